@@ -0,0 +1,7 @@
+"""
+grader_common
+─────────────────────────────────────────────────────────
+Pieces shared by initial_assessment_grader and module_quiz_grader.
+Each service puts the repository root on sys.path and imports
+from here.
+"""
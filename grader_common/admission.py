@@ -0,0 +1,69 @@
+"""
+admission.py
+─────────────────────────────────────────────────────────
+Admission control for the grader endpoints: at most MAX_INFLIGHT
+requests grade at once, at most MAX_QUEUE wait for a slot.  Anything
+beyond that is rejected right away with 429 + Retry-After, and a
+request that waited longer than QUEUE_TIMEOUT gets 503 + Retry-After,
+so load spikes are pushed back to the client instead of piling up.
+"""
+
+import asyncio, os
+from contextlib import asynccontextmanager
+from fastapi import HTTPException
+
+# ─── config ────────────────────────────────────────────
+MAX_INFLIGHT  = int(os.getenv("ICAT_MAX_INFLIGHT", "8"))
+MAX_QUEUE     = int(os.getenv("ICAT_MAX_QUEUE", "64"))
+QUEUE_TIMEOUT = float(os.getenv("ICAT_QUEUE_TIMEOUT", "30"))   # seconds
+RETRY_AFTER   = int(os.getenv("ICAT_RETRY_AFTER", "5"))        # seconds
+
+
+class AdmissionGate:
+    def __init__(self, max_inflight=MAX_INFLIGHT, max_queue=MAX_QUEUE,
+                 queue_timeout=QUEUE_TIMEOUT, retry_after=RETRY_AFTER):
+        """
+        Args:
+            max_inflight (int): Requests allowed to grade concurrently
+            max_queue (int): Requests allowed to wait for a free slot
+            queue_timeout (float): Seconds a request may wait before 503
+            retry_after (int): Value of the Retry-After header on rejection
+        """
+        self.max_inflight = max_inflight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self._slots = asyncio.Semaphore(max_inflight)
+        self._inflight = 0
+        self._waiting = 0
+
+    def _reject(self, status_code: int, detail: str):
+        return HTTPException(status_code=status_code, detail=detail,
+                             headers={"Retry-After": str(self.retry_after)})
+
+    @asynccontextmanager
+    async def admit(self):
+        """Hold one grading slot for the duration of the `async with` block."""
+        if self._slots.locked():
+            if self._waiting >= self.max_queue:
+                raise self._reject(429, "Grader queue is full, retry later.")
+            self._waiting += 1
+            try:
+                await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                raise self._reject(503, "Grader is busy, retry later.")
+            finally:
+                self._waiting -= 1
+        else:
+            await self._slots.acquire()
+
+        self._inflight += 1
+        try:
+            yield
+        finally:
+            self._inflight -= 1
+            self._slots.release()
+
+    def stats(self) -> dict:
+        return {"inflight": self._inflight, "waiting": self._waiting,
+                "max_inflight": self.max_inflight, "max_queue": self.max_queue}
@@ -0,0 +1,69 @@
+"""
+NDJSON streaming for the /grade_batch endpoints.
+
+A batch takes one admission slot for its whole lifetime (its LLM calls
+are throttled by the service's own concurrency limit), and streams one
+line per submission as soon as that submission is graded:
+
+    {"index": 3, "id": "<assessment/quiz id>", "result": {...}}
+    {"index": 4, "id": "...", "error": {"status": 500, "detail": "..."}}
+
+Lines arrive in completion order; `index` is the submission's position
+in the request.  If the client goes away, the unfinished submissions are
+cancelled before the admission slot is given back, so a dropped batch
+stops making LLM calls.
+"""
+
+import asyncio
+import json
+import os
+from contextlib import AsyncExitStack
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+
+MAX_BATCH = int(os.getenv("ICAT_BATCH_MAX", "500"))   # submissions per request
+
+
+def check_size(n: int):
+    if n > MAX_BATCH:
+        raise HTTPException(status_code=413,
+                            detail=f"Batch of {n} submissions exceeds ICAT_BATCH_MAX={MAX_BATCH}")
+
+
+async def _line(index: int, submission_id: str, coro) -> str:
+    try:
+        row = {"index": index, "id": submission_id, "result": await coro}
+    except HTTPException as e:
+        row = {"index": index, "id": submission_id,
+               "error": {"status": e.status_code, "detail": e.detail}}
+    except Exception as e:
+        row = {"index": index, "id": submission_id, "error": {"status": 500, "detail": str(e)}}
+    return json.dumps(row, ensure_ascii=False) + "\n"
+
+
+async def stream_batch(gate, prepare) -> StreamingResponse:
+    """
+    Admit the batch through `gate` (429/503 happen before anything is
+    streamed), await `prepare()` for its [(submission id, coroutine), …]
+    and stream each coroutine's result as it completes.
+    """
+    stack = AsyncExitStack()
+    await stack.enter_async_context(gate.admit())
+    try:
+        jobs = await prepare()
+    except BaseException:
+        await stack.aclose()
+        raise
+
+    async def lines():
+        tasks = [asyncio.ensure_future(_line(i, sub_id, coro)) for i, (sub_id, coro) in enumerate(jobs)]
+        try:
+            for done in asyncio.as_completed(tasks):
+                yield await done
+        finally:
+            for task in tasks:
+                task.cancel()           # no-op once finished
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await stack.aclose()
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
@@ -0,0 +1,146 @@
+"""
+cache.py
+─────────────────────────────────────────────────────────
+Content-addressed cache of per-question grading results, shared by
+both grader services (same SQLite file by default).
+
+Key  = sha256(model, system-prompt version, question id, rubric,
+              normalized user answer)
+Value = {"score": float, "explanation": str}
+        (the initial-assessment grader also keeps {"feedback": str} under a
+        key made from all answers of a submission)
+
+A small in-memory LRU sits in front of SQLite so repeated answers
+("No answer.", empty strings, copy-pasted phrases) are served without
+touching disk; SQLite rows are evicted by TTL and least-recent access.
+"""
+
+import hashlib, json, os, re, sqlite3, threading, time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+# ─── config ────────────────────────────────────────────
+CACHE_PATH    = os.getenv("ICAT_GRADE_CACHE",
+                          str(Path(__file__).resolve().parent.parent / "grading_cache.sqlite3"))
+CACHE_TTL     = float(os.getenv("ICAT_GRADE_CACHE_TTL", str(7 * 24 * 3600)))  # seconds
+CACHE_MAX     = int(os.getenv("ICAT_GRADE_CACHE_MAX", "100000"))              # SQLite rows
+CACHE_MEM_MAX = int(os.getenv("ICAT_GRADE_CACHE_MEM", "2048"))                # in-memory entries
+
+_WS    = re.compile(r"\s+")
+_TRAIL = re.compile(r"[\s.!?,;:]+$")
+
+
+def prompt_version(system_prompt: str) -> str:
+    """Short fingerprint of a system prompt; editing the prompt invalidates old entries."""
+    return hashlib.sha256(system_prompt.strip().encode("utf-8")).hexdigest()[:12]
+
+
+def normalize_answer(text: Optional[str]) -> str:
+    """Lower-case, collapse whitespace and drop trailing punctuation."""
+    text = _WS.sub(" ", (text or "").strip().lower())
+    return _TRAIL.sub("", text)
+
+
+def make_key(model: str, prompt_ver: str, question_id: str, rubric, user_answer: Optional[str]) -> str:
+    material = json.dumps([model, prompt_ver, question_id, rubric, normalize_answer(user_answer)],
+                          sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class GradingCache:
+    def __init__(self, path=CACHE_PATH, ttl=CACHE_TTL, max_entries=CACHE_MAX, mem_entries=CACHE_MEM_MAX):
+        """
+        Args:
+            path (str): SQLite file; "off" disables the cache
+            ttl (float): Seconds an entry stays valid
+            max_entries (int): SQLite rows kept before LRU eviction
+            mem_entries (int): Entries kept in the in-memory front
+        """
+        self.enabled = path != "off"
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.mem_entries = mem_entries
+        self.hits = self.misses = 0
+        self._mem = OrderedDict()        # key -> (created, value)
+        self._lock = threading.Lock()
+        self._puts = 0
+        if not self.enabled:
+            return
+
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS grades ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+            " created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS grades_accessed ON grades(accessed)")
+        self._db.commit()
+
+    def _remember(self, key: str, created: float, value: dict):
+        self._mem[key] = (created, value)
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.mem_entries:
+            self._mem.popitem(last=False)
+
+    def get(self, key: str) -> Optional[dict]:
+        """Return a copy of the cached result, or None on a miss."""
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            hit = self._mem.get(key)
+            if hit is not None and now - hit[0] < self.ttl:
+                self._mem.move_to_end(key)
+                self.hits += 1
+                return dict(hit[1])
+
+            row = self._db.execute("SELECT value, created FROM grades WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] >= self.ttl:
+                if row is not None:
+                    self._db.execute("DELETE FROM grades WHERE key = ?", (key,))
+                    self._db.commit()
+                self._mem.pop(key, None)
+                self.misses += 1
+                return None
+
+            self._db.execute("UPDATE grades SET accessed = ? WHERE key = ?", (now, key))
+            self._db.commit()
+            value = json.loads(row[0])
+            self._remember(key, row[1], value)
+            self.hits += 1
+            return dict(value)
+
+    def put(self, key: str, value: dict):
+        if not self.enabled:
+            return
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO grades (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now, now)
+            )
+            self._remember(key, now, dict(value))
+            self._puts += 1
+            if self._puts % 100 == 0:
+                self._evict(now)
+            self._db.commit()
+
+    def _evict(self, now: float):
+        """Drop expired rows, then the least recently used ones above max_entries."""
+        self._db.execute("DELETE FROM grades WHERE created <= ?", (now - self.ttl,))
+        (count,) = self._db.execute("SELECT COUNT(*) FROM grades").fetchone()
+        if count > self.max_entries:
+            self._db.execute(
+                "DELETE FROM grades WHERE key IN "
+                "(SELECT key FROM grades ORDER BY accessed LIMIT ?)",
+                (count - self.max_entries,)
+            )
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {"enabled": self.enabled, "hits": self.hits, "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "memory_entries": len(self._mem)}
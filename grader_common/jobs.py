@@ -0,0 +1,301 @@
+"""
+jobs.py
+─────────────────────────────────────────────────────────
+Asynchronous grading jobs backed by SQLite, for runs that should not
+hold an HTTP request open while Ollama works.
+
+    POST /jobs/<endpoint>   → 202 {"job_id", "status"} right away
+    GET  /jobs/{job_id}?wait=30
+                            → the job; waits up to `wait` seconds
+                              (long-poll) while it is still queued/running
+
+Submissions are idempotent by payload hash: posting the same payload
+again while the first job is queued, running or done returns that job
+instead of grading twice (clients can retry safely).
+
+Jobs are rows in the `jobs` table (both services, and several workers
+of one service, can share the file; each only runs its own kinds).  A
+small pool of worker tasks claims queued rows, calls the service's
+handler and stores the result, so jobs survive a restart.  A claimed row
+carries its process's owner id and a heartbeat renewed every LEASE/3
+seconds; a 'running' row whose lease expired (its process died) is
+queued again by any live process (up to MAX_ATTEMPTS), while rows a live
+process is still working on are left alone.
+
+A handler rejected by the admission gate (429/503) is put back with an
+exponential delay (at least its Retry-After) and does not use up an
+attempt: busy spikes are what the queue is for.
+"""
+
+import asyncio, hashlib, json, os, sqlite3, threading, time, uuid
+from pathlib import Path
+from typing import Optional
+from fastapi import HTTPException
+
+# ─── config ────────────────────────────────────────────
+JOBS_PATH    = os.getenv("ICAT_JOBS_DB",
+                         str(Path(__file__).resolve().parent.parent / "grading_jobs.sqlite3"))
+JOB_WORKERS  = int(os.getenv("ICAT_JOB_WORKERS", "2"))           # jobs graded at once per process
+JOB_TTL      = float(os.getenv("ICAT_JOB_TTL", str(24 * 3600)))  # finished jobs kept, seconds
+MAX_ATTEMPTS = int(os.getenv("ICAT_JOB_MAX_ATTEMPTS", "3"))      # runs per job (busy retries don't count)
+MAX_WAIT     = float(os.getenv("ICAT_JOB_MAX_WAIT", "60"))       # longest long-poll, seconds
+LEASE        = float(os.getenv("ICAT_JOB_LEASE", "60"))          # heartbeat silence before a job is re-queued
+MAX_BUSY_DELAY = 60.0                                            # cap of the busy-retry backoff, seconds
+POLL_EVERY   = 1.0                                               # seconds between DB checks
+
+FINISHED = ("done", "failed")
+
+
+def payload_hash(kind: str, payload: dict) -> str:
+    material = json.dumps([kind, payload], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class JobQueue:
+    def __init__(self, handlers: dict, path=JOBS_PATH, workers=JOB_WORKERS, ttl=JOB_TTL):
+        """
+        Args:
+            handlers (dict): kind -> async fn(payload dict) -> result dict
+            path (str): SQLite file
+            workers (int): Worker tasks started by start()
+            ttl (float): Seconds a finished job is kept
+        """
+        self.handlers = handlers
+        self.workers = workers
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._tasks = []
+        self._running = False
+        self._wakeup = None              # asyncio.Event, created in start()
+        self._loop = None                # the workers' event loop, set in start()
+        self._finished = {}              # job id -> asyncio.Event for long-polls
+        self.owner = uuid.uuid4().hex    # this process's lease holder id
+
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY, kind TEXT NOT NULL, payload TEXT NOT NULL,"
+            " payload_hash TEXT NOT NULL, status TEXT NOT NULL,"
+            " result TEXT, error TEXT, attempts INTEGER NOT NULL DEFAULT 0,"
+            " created REAL NOT NULL, not_before REAL NOT NULL,"
+            " started REAL, finished REAL,"
+            " owner TEXT, heartbeat REAL, busy_retries INTEGER NOT NULL DEFAULT 0)"
+        )
+        # files created before leases existed
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(jobs)")}
+        for column, decl in (("owner", "TEXT"), ("heartbeat", "REAL"),
+                             ("busy_retries", "INTEGER NOT NULL DEFAULT 0")):
+            if column not in columns:
+                self._db.execute(f"ALTER TABLE jobs ADD COLUMN {column} {decl}")
+        self._db.execute("CREATE UNIQUE INDEX IF NOT EXISTS jobs_payload ON jobs(payload_hash)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_queue ON jobs(status, kind, not_before)")
+        self._db.commit()
+
+    # ─── rows ──────────────────────────────────────────
+    def _row(self, job_id: str) -> Optional[dict]:
+        cur = self._db.execute(
+            "SELECT id, kind, status, result, error, attempts, created, started, finished"
+            " FROM jobs WHERE id = ?", (job_id,))
+        row = cur.fetchone()
+        if row is None:
+            return None
+        job = dict(zip([c[0] for c in cur.description], row))
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        job["error"] = json.loads(job["error"]) if job["error"] else None
+        return job
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            return self._row(job_id)
+
+    def submit(self, kind: str, payload: dict) -> dict:
+        """
+        Queue a job, or return the live/done job already holding this payload.
+        Safe to call from a threadpool (sync endpoints): the workers are
+        woken on their own loop.
+        """
+        digest = payload_hash(kind, payload)
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT id, status, finished FROM jobs WHERE payload_hash = ?",
+                                   (digest,)).fetchone()
+            if row is not None:
+                job_id, status, finished = row
+                if status != "failed" and not (finished and now - finished >= self.ttl):
+                    return self._row(job_id)
+                self._db.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+            job_id = uuid.uuid4().hex
+            self._db.execute(
+                "INSERT INTO jobs (id, kind, payload, payload_hash, status, created, not_before)"
+                " VALUES (?, ?, ?, ?, 'queued', ?, ?)",
+                (job_id, kind, json.dumps(payload, ensure_ascii=False), digest, now, now))
+            self._db.commit()
+            job = self._row(job_id)
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+        return job
+
+    def _our_kinds(self) -> str:
+        return f"kind IN ({','.join('?' * len(self.handlers))})"
+
+    def _claim(self) -> Optional[tuple]:
+        """Atomically move the oldest due job of our kinds to 'running'."""
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT id, kind, payload FROM jobs WHERE status = 'queued'"
+                f" AND {self._our_kinds()} AND not_before <= ?"
+                f" ORDER BY created LIMIT 1", (*self.handlers, now)).fetchone()
+            if row is None:
+                return None
+            cur = self._db.execute(
+                "UPDATE jobs SET status = 'running', started = ?, attempts = attempts + 1,"
+                " owner = ?, heartbeat = ? WHERE id = ? AND status = 'queued'",
+                (now, self.owner, now, row[0]))
+            self._db.commit()
+            return row if cur.rowcount else None
+
+    def _finish(self, job_id: str, status: str, result=None, error=None):
+        with self._lock:
+            # only while we hold the lease; a re-queued job belongs to its new worker
+            self._db.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished = ?"
+                " WHERE id = ? AND owner = ?",
+                (status, json.dumps(result) if result is not None else None,
+                 json.dumps(error) if error is not None else None, time.time(),
+                 job_id, self.owner))
+            self._db.commit()
+        event = self._finished.pop(job_id, None)
+        if event is not None:
+            event.set()
+
+    def _retry_busy(self, job_id: str, retry_after: float):
+        """Put a job the admission gate turned away back, without spending an attempt."""
+        with self._lock:
+            busy = self._db.execute("SELECT busy_retries FROM jobs WHERE id = ?",
+                                    (job_id,)).fetchone()[0]
+            delay = max(retry_after, min(MAX_BUSY_DELAY, POLL_EVERY * 2 ** busy))
+            self._db.execute(
+                "UPDATE jobs SET status = 'queued', not_before = ?, attempts = attempts - 1,"
+                " busy_retries = busy_retries + 1, owner = NULL, heartbeat = NULL WHERE id = ?",
+                (time.time() + delay, job_id))
+            self._db.commit()
+
+    def _heartbeat(self):
+        """Renew the lease on every job this process is running."""
+        with self._lock:
+            self._db.execute("UPDATE jobs SET heartbeat = ? WHERE owner = ? AND status = 'running'",
+                             (time.time(), self.owner))
+            self._db.commit()
+
+    def _recover(self):
+        """Queue jobs whose lease expired (their process died); fail those out of attempts."""
+        gave_up = json.dumps({"status": 500, "detail": "Gave up after repeated restarts"})
+        expired = time.time() - LEASE
+        dead = (f"status = 'running' AND {self._our_kinds()}"
+                f" AND COALESCE(heartbeat, started, 0) < ?")
+        with self._lock:
+            self._db.execute(
+                f"UPDATE jobs SET status = 'failed', finished = ?, error = ?"
+                f" WHERE {dead} AND attempts >= ?",
+                (time.time(), gave_up, *self.handlers, expired, MAX_ATTEMPTS))
+            cur = self._db.execute(
+                f"UPDATE jobs SET status = 'queued', owner = NULL, heartbeat = NULL WHERE {dead}",
+                (*self.handlers, expired))
+            self._db.execute("DELETE FROM jobs WHERE finished IS NOT NULL AND finished <= ?",
+                             (time.time() - self.ttl,))
+            self._db.commit()
+        if cur.rowcount:
+            print(f"Re-queued {cur.rowcount} jobs whose worker stopped heartbeating.")
+
+    async def _keep_leases(self):
+        """Heartbeat our jobs and recover expired ones, every LEASE/3 seconds."""
+        while self._running:
+            try:
+                await asyncio.wait_for(self._stopping.wait(), LEASE / 3)
+            except asyncio.TimeoutError:
+                pass
+            if self._running:
+                self._heartbeat()
+                self._recover()
+
+    # ─── workers ───────────────────────────────────────
+    async def _work(self):
+        while self._running:
+            claimed = self._claim()
+            if claimed is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), POLL_EVERY)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            job_id, kind, payload = claimed
+            try:
+                result = await self.handlers[kind](json.loads(payload))
+            except HTTPException as e:
+                if e.status_code in (429, 503):
+                    self._retry_busy(job_id, float((e.headers or {}).get("Retry-After", POLL_EVERY)))
+                else:
+                    self._finish(job_id, "failed", error={"status": e.status_code, "detail": e.detail})
+            except Exception as e:
+                print(f"Job {job_id} failed: {e}")
+                self._finish(job_id, "failed", error={"status": 500, "detail": str(e)})
+            else:
+                self._finish(job_id, "done", result=result)
+
+    def start(self):
+        """Recover interrupted jobs and start the worker tasks (call on startup)."""
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._stopping = asyncio.Event()
+        self._running = True
+        self._recover()
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._keep_leases()))
+
+    async def stop(self):
+        """Cancel the workers and queue the jobs they were running again."""
+        self._running = False           # wait_for() may swallow a cancel on 3.11
+        self._loop = None
+        self._stopping.set()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        with self._lock:
+            self._db.execute("UPDATE jobs SET status = 'queued', owner = NULL, heartbeat = NULL"
+                             " WHERE owner = ? AND status = 'running'", (self.owner,))
+            self._db.commit()
+
+    async def wait(self, job_id: str, timeout: float) -> Optional[dict]:
+        """Return the job once finished, or as it is after `timeout` seconds."""
+        deadline = time.monotonic() + min(max(timeout, 0.0), MAX_WAIT)
+        while True:
+            job = self.get(job_id)
+            remaining = deadline - time.monotonic()
+            if job is None or job["status"] in FINISHED or remaining <= 0:
+                self._finished.pop(job_id, None)
+                return job
+            # woken by our own workers; the DB poll covers other processes
+            event = self._finished.setdefault(job_id, asyncio.Event())
+            try:
+                await asyncio.wait_for(event.wait(), min(remaining, POLL_EVERY))
+            except asyncio.TimeoutError:
+                pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            rows = self._db.execute(f"SELECT status, COUNT(*) FROM jobs WHERE {self._our_kinds()}"
+                                    f" GROUP BY status", tuple(self.handlers)).fetchall()
+        return dict(rows)
+
+
+def job_response(job: Optional[dict]):
+    """HTTP body for a job; 404 if unknown."""
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job id")
+    return job
@@ -0,0 +1,47 @@
+"""
+llm.py
+─────────────────────────────────────────────────────────
+One pooled, keep-alive ollama.AsyncClient per process.  Every
+grading call in a service goes through chat(), so connections to
+Ollama are reused instead of re-opened per request.
+"""
+
+import os
+import httpx
+from ollama import AsyncClient
+
+# ─── config ────────────────────────────────────────────
+OLLAMA_HOST      = os.getenv("OLLAMA_HOST", "http://127.0.0.1:11434")
+POOL_SIZE        = int(os.getenv("ICAT_OLLAMA_POOL_SIZE", "16"))      # max open connections
+KEEPALIVE_EXPIRY = float(os.getenv("ICAT_OLLAMA_KEEPALIVE", "60"))    # seconds idle before closing
+LLM_TIMEOUT      = float(os.getenv("ICAT_OLLAMA_TIMEOUT", "300"))     # seconds per generation
+
+_client = None
+
+
+def get_client() -> AsyncClient:
+    """Return the process-wide AsyncClient, creating it on first use."""
+    global _client
+    if _client is None:
+        _client = AsyncClient(
+            host=OLLAMA_HOST,
+            timeout=httpx.Timeout(LLM_TIMEOUT, connect=10.0),
+            limits=httpx.Limits(max_connections=POOL_SIZE,
+                                max_keepalive_connections=POOL_SIZE,
+                                keepalive_expiry=KEEPALIVE_EXPIRY),
+        )
+    return _client
+
+
+async def close_client():
+    """Close the pooled connections (call from the app's shutdown hook)."""
+    global _client
+    if _client is not None:
+        await _client._client.aclose()
+        _client = None
+
+
+async def chat(model: str, messages: list) -> str:
+    """Send a non-streaming chat and return the raw message text."""
+    rsp = await get_client().chat(model=model, messages=messages, stream=False)
+    return rsp["message"]["content"]
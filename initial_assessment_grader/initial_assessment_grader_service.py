@@ -109,31 +109,47 @@
 #             content={"detail":"Model sent non-JSON", "body": raw[:300]}
 #         )
 
-import json, os, re
+import asyncio, json, os, re, sys
+from pathlib import Path
 from typing import List, Optional
 from fastapi import FastAPI, HTTPException
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel, Field, validator
-from ollama import Client
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))   # repo root → grader_common
+from grader_common import llm
+from grader_common.admission import AdmissionGate
+from grader_common.cache import GradingCache, make_key, prompt_version
+from grader_common import batch
+from grader_common.jobs import JobQueue, job_response
 
 # ─────────────────────────────────────────────────────────────────────────────
 #  CONFIGURATION
 # ─────────────────────────────────────────────────────────────────────────────
 OLLAMA_MODEL = os.getenv("ICAT_MODEL", "qwen2.5:7b")
-OLLAMA_HOST  = os.getenv("OLLAMA_HOST", "http://127.0.0.1:11434")
-_client = Client(host=OLLAMA_HOST)
+# Ollama host / connection pool: see grader_common/llm.py (OLLAMA_HOST, ICAT_OLLAMA_*)
+# In-flight and queue limits: see grader_common/admission.py (ICAT_MAX_*)
+_gate = AdmissionGate()
+# Per-question result cache: see grader_common/cache.py (ICAT_GRADE_CACHE*)
+_cache = GradingCache()
+# LLM calls a /grade_batch request runs at once
+BATCH_CONCURRENCY = int(os.getenv("ICAT_BATCH_CONCURRENCY", "4"))
+_batch_slots = asyncio.Semaphore(BATCH_CONCURRENCY)
 
 # ─────────────────────────────────────────────────────────────────────────────
-#  SYSTEM PROMPT (updated)
+#  SYSTEM PROMPT (hybrid grading: MCQs are scored locally, see grade())
 # ─────────────────────────────────────────────────────────────────────────────
 SYSTEM_PROMPT = """
 <introduction>
-You are *iCAT Initial-Assessment Grader v1*, a friendly security‐awareness instructor. 
-You receive a JSON object with an array called `questions`. Each element provides:
+You are *iCAT Initial-Assessment Grader v2*, a friendly security‐awareness instructor. 
+The platform has already scored every MCQ. You receive a JSON object with:
+  • `mcq_summary`   – {correct, total}: how the learner did on all MCQs
+  • `questions`     – only the items that need your judgement: MCQs the learner got wrong, and short-essay questions.
+Each element of `questions` provides:
   • `id`            – unique question_id
   • `type`          – "mcq" or "essay"
   • `stem`          – the question text
-  • `choices`       – array of answer choices (MCQ only)
+  • `choices`       – array of answer choices (MCQ only), in order A, B, C, D
   • `user_answer`   – the learner’s answer
   • `correct_choice` (MCQ only)
   • `rubric`          (essay only) → list of {point,value,weight}
@@ -142,12 +158,10 @@ You receive a JSON object with an array called `questions`. Each element provide
 <instructions>
 Before grading each question, thoroughly analyze the question to provide accurate feedback.
 
-Grade each question as follows:
-  – **MCQ**:  
-    • If the learner’s choice matches `correct_choice`, give `score`: 1 and explanation: “Correct.”  
-    • Otherwise, give `score`: 0 and a one‐sentence explanation stating exactly why **that specific chosen option** is wrong (not a generic wrong).
+Handle each question as follows:
+  – **MCQ** (always a wrong pick):  
+    • Give `score`: 0 and a one‐sentence explanation stating exactly why **that specific chosen option** is wrong (not a generic wrong).
     • Example: “Option A is wrong because it doesn’t check the sender’s domain; the email came from a spoofed address.”
-    • If `user_answer` is empty or null, assume the user's answer is incorrect and give `score`: 0 with a generic explanation like “You did not select an answer.”
 
   – **Essay**:  
     • Compare `user_answer` against each rubric item.  
@@ -175,28 +189,25 @@ Return **only** a raw JSON object (no markdown fences, no extra text) in this ex
     …  
   ],
   "overall": {
-    "score": float (sum of individual scores, e.g. 13.40),
-    "max_score": float (total questions, e.g. 20.00),
-    "percentage": int (rounded percentage),
-    "feedback": "###:XX.XX – Brief summary paragraph: strengths, weaknesses, suggestions."
+    "feedback": "Brief summary paragraph: strengths, weaknesses, suggestions."
   }
 }
 </output_format>
 
 <notes>
 Guidelines:
-  • For MCQ explanations: if correct, just “Correct.”  
-    If incorrect, point out why that chosen letter is wrong (e.g., “Option A is wrong because it doesn’t check the sender’s domain; the email came from a spoofed address.”).
+  • Return exactly one element in `scores` for every element of `questions`, using the same `id`.
+  • For MCQ explanations, point out why that chosen letter is wrong (e.g., “Option A is wrong because it doesn’t check the sender’s domain; the email came from a spoofed address.”).
   • For essays: speak as a friendly teacher. Mention specifically which rubric points they nailed and which they missed (e.g., “You noted the correct URL mismatch but forgot to mention reporting to IT.”).
-  • The **overall.feedback** string should provide a brief summary of strengths and about one or two areas to improve (if found) regarding both MCQ and essay questions (e.g., "You demonstrated strong phishing awareness but need to work on …”).
-  • The overall feedback should be in regards of the MCQ and short-essay questions, both.
-    • Ensure the overall score is calculated as the sum of individual scores, with a maximum score equal to the number of questions. The percentage should be rounded to 2 decimal places.
+  • The **overall.feedback** string should provide a brief summary of strengths and about one or two areas to improve (if found) regarding both MCQ and essay questions (e.g., "You demonstrated strong phishing awareness but need to work on …”). Use `mcq_summary` for the MCQs you did not see.
+  • Do **not** compute totals; the platform adds up the scores.
   • Do **not** include any other commentary or formatting—return exactly the JSON structure above.
 
 Make your voice friendly, modern, and encouraging in the feedback, as if you’re a classroom instructor giving personalized tips.
 Only return the JSON object, no extra text or formatting.
 </notes>
 """
+PROMPT_VERSION = prompt_version(SYSTEM_PROMPT)
 
 
 # ─────────────────────────────────────────────────────────────────────────────
@@ -233,50 +244,301 @@ class AssessmentIn(BaseModel):
     assessment_id: str
     questions: List[QuestionIn]
 
+class AssessmentBatchIn(BaseModel):
+    submissions: List[AssessmentIn] = Field(..., min_length=1)
+
 # ─────────────────────────────────────────────────────────────────────────────
 #  FastAPI app
 # ─────────────────────────────────────────────────────────────────────────────
 app = FastAPI(title="iCAT Grader", version="1.0.0")
 
+@app.on_event("startup")
+async def _start_jobs():
+    _jobs.start()
+
+@app.on_event("shutdown")
+async def _close_llm_pool():
+    await _jobs.stop()
+    await llm.close_client()
+
 def _strip_md_fence(text: str) -> str:
     """Remove ``` fences if present."""
     pattern = r"^```(?:json)?\s*(.*?)\s*```$"
     m = re.match(pattern, text.strip(), re.DOTALL | re.IGNORECASE)
     return m.group(1) if m else text
 
-def _build_messages(payload: AssessmentIn):
+def _score_mcq(q: QuestionIn) -> Optional[dict]:
+    """
+    Score an MCQ locally.  Returns None for a wrong pick, which still
+    needs an LLM-written explanation (its score is always 0).
+    """
+    choice = q.user_answer.strip().upper()
+    if choice == q.correct_choice:
+        return {"id": q.id, "score": 1.0, "explanation": "Correct."}
+    if not choice:
+        return {"id": q.id, "score": 0.0, "explanation": "You did not select an answer."}
+    return None
+
+def _mcq_fallback(q: QuestionIn) -> str:
+    """Used when the model skips the explanation for a wrong MCQ pick."""
+    choice = q.user_answer.strip().upper()
+    return f"Option {choice} is not the safest choice; the correct answer is {q.correct_choice}."
+
+def _clamp_score(value) -> float:
+    try:
+        return round(min(max(float(value), 0.0), 1.0), 2)
+    except (TypeError, ValueError):
+        return 0.0
+
+def _cache_key(q: QuestionIn) -> str:
+    material = [r.model_dump() for r in q.rubric] if q.rubric else q.correct_choice
+    return make_key(OLLAMA_MODEL, PROMPT_VERSION, q.id, material, q.user_answer)
+
+def _feedback_key(assessment: AssessmentIn) -> str:
+    """Cache key of the overall feedback: the same answers to the same questions."""
+    return make_key(OLLAMA_MODEL, PROMPT_VERSION, "overall",
+                    sorted(_cache_key(q) for q in assessment.questions), None)
+
+def _template_feedback(assessment: AssessmentIn, results: dict, mcq_correct: int, mcq_total: int) -> str:
+    """Overall feedback when the LLM wrote none (all MCQs right, or every answer cached)."""
+    essays = [results[q.id]["score"] for q in assessment.questions if q.type == "essay"]
+    if not mcq_total and not essays:
+        return "There were no questions to grade."
+    if mcq_correct == mcq_total and all(score == 1.0 for score in essays):
+        return ("Great work! You answered every question fully and correctly, which shows "
+                "solid everyday security awareness. Keep it up!")
+    parts = []
+    if mcq_total:
+        parts.append(f"answered {mcq_correct} of {mcq_total} multiple-choice questions correctly")
+    if essays:
+        average = round(100 * sum(essays) / len(essays))
+        parts.append(f"scored {average}% on average across {len(essays)} written "
+                     f"answer{'s' if len(essays) != 1 else ''}")
+    return (f"You {' and '.join(parts)}. "
+            "Review the explanations above to strengthen the areas you missed.")
+
+def _overall_feedback(assessment: AssessmentIn, results: dict, mcq_correct: int, mcq_total: int) -> str:
+    """Feedback the LLM wrote for these exact answers before, else a template."""
+    cached = _cache.get(_feedback_key(assessment))
+    if cached and cached.get("feedback"):
+        return cached["feedback"]
+    return _template_feedback(assessment, results, mcq_correct, mcq_total)
+
+def _build_messages(pending: List[QuestionIn], mcq_correct: int, mcq_total: int):
     """
     Build a two-turn chat:
       1) system instructions,
-      2) explicit “GRADE this JSON” + the payload.
+      2) explicit “GRADE this JSON” + the questions that still need the LLM.
     """
-    # 1) system prompt remains unchanged
     system_msg = {"role": "system", "content": SYSTEM_PROMPT.strip()}
 
-    # 2) user message must tell the LLM: “Here is the learner’s submission; grade it.”
     grading_directive = "GRADE the following assessment JSON.  Respond with a new JSON containing only “scores” and “overall”, as specified:\n"
-    user_content = grading_directive + payload.model_dump_json()
-    user_msg = {"role": "user", "content": user_content}
+    user_json = json.dumps({
+        "mcq_summary": {"correct": mcq_correct, "total": mcq_total},
+        "questions":   [q.model_dump() for q in pending],
+    })
+    user_msg = {"role": "user", "content": grading_directive + user_json}
 
     return [system_msg, user_msg]
 
-def _ask_llm(payload: AssessmentIn) -> str:
-    rsp = _client.chat(
-        model=OLLAMA_MODEL,
-        messages=_build_messages(payload),
-        stream=False
-    )
-    return rsp["message"]["content"]
+async def _ask_llm(pending: List[QuestionIn], mcq_correct: int, mcq_total: int) -> str:
+    return await llm.chat(OLLAMA_MODEL, _build_messages(pending, mcq_correct, mcq_total))
 
-@app.post("/grade")
-def grade(assessment: AssessmentIn):
-    raw = _ask_llm(assessment)
+def _assemble(scores: List[dict], feedback: str) -> dict:
+    """Build the response totals in Python instead of trusting the model's arithmetic."""
+    total     = round(sum(s["score"] for s in scores), 2)
+    max_score = float(len(scores))
+    return {
+        "scores": scores,
+        "overall": {
+            "score": total,
+            "max_score": max_score,
+            "percentage": round(100 * total / max_score, 2) if max_score else 0.0,
+            "feedback": feedback,
+        },
+    }
+
+class ModelOutputError(Exception):
+    """The model's reply could not be used; `content` is the 500 response body."""
+    def __init__(self, content: dict):
+        super().__init__(content["detail"])
+        self.content = content
+
+def _score_locally(assessment: AssessmentIn):
+    """
+    Score MCQs locally and serve cached answers.  Returns the results so
+    far, the questions that still need the LLM, and the MCQ tally.
+    """
+    results, pending = {}, []
+    for q in assessment.questions:
+        local = _score_mcq(q) if q.type == "mcq" else None
+        if local is None:
+            local = _cache.get(_cache_key(q))
+        if local is not None:
+            results[q.id] = {"id": q.id, "score": local["score"], "explanation": local["explanation"]}
+        else:
+            pending.append(q)
+
+    mcq_total   = sum(q.type == "mcq" for q in assessment.questions)
+    mcq_correct = sum(q.type == "mcq" and results.get(q.id, {}).get("score") == 1.0
+                      for q in assessment.questions)
+    return results, pending, mcq_correct, mcq_total
+
+def _apply_llm_grades(raw: str, pending: List[QuestionIn], results: dict) -> Optional[str]:
+    """
+    Merge the model's scores for `pending` into `results` (and the cache).
+    Returns the model's overall feedback, if any.
+    """
     clean = _strip_md_fence(raw)
     try:
-        return json.loads(clean)
+        graded = json.loads(clean)
     except json.JSONDecodeError:
-        return JSONResponse(
-            status_code=500,
-            content={"detail": "Model still sent non-JSON", "body": clean[:300]}
-        )
+        raise ModelOutputError({"detail": "Model still sent non-JSON", "body": clean[:300]})
+    if not isinstance(graded, dict):
+        raise ModelOutputError({"detail": "Model did not send a JSON object", "body": clean[:300]})
+
+    scores = graded.get("scores")
+    by_id = {s.get("id"): s for s in (scores if isinstance(scores, list) else [])
+             if isinstance(s, dict)}
+    for q in pending:
+        s = by_id.get(q.id)
+        if q.type == "mcq":
+            if (s or {}).get("explanation"):
+                results[q.id] = {"id": q.id, "score": 0.0, "explanation": s["explanation"]}
+                _cache.put(_cache_key(q), {"score": 0.0, "explanation": s["explanation"]})
+            else:
+                results[q.id] = {"id": q.id, "score": 0.0, "explanation": _mcq_fallback(q)}
+        elif s is None:
+            raise ModelOutputError({"detail": f"Model did not grade question {q.id}", "body": clean[:300]})
+        else:
+            results[q.id] = {"id": q.id, "score": _clamp_score(s.get("score")),
+                             "explanation": s.get("explanation", "")}
+            _cache.put(_cache_key(q), {"score": results[q.id]["score"],
+                                       "explanation": results[q.id]["explanation"]})
+    overall = graded.get("overall")
+    return overall.get("feedback") if isinstance(overall, dict) else None
+
+@app.post("/grade")
+async def grade(assessment: AssessmentIn):
+    """
+    Hybrid grading: MCQs are scored locally; only wrong MCQ picks (for an
+    explanation) and essays (for a score) are sent to the LLM, unless an
+    identical answer to the same question is already in the cache.
+    """
+    results, pending, mcq_correct, mcq_total = _score_locally(assessment)
+
+    if not pending:
+        scores = [results[q.id] for q in assessment.questions]
+        return _assemble(scores, _overall_feedback(assessment, results, mcq_correct, mcq_total))
+
+    async with _gate.admit():
+        raw = await _ask_llm(pending, mcq_correct, mcq_total)
+    try:
+        feedback = _apply_llm_grades(raw, pending, results)
+    except ModelOutputError as e:
+        return JSONResponse(status_code=500, content=e.content)
+
+    if feedback:
+        _cache.put(_feedback_key(assessment), {"feedback": feedback})
+    else:
+        feedback = _overall_feedback(assessment, results, mcq_correct, mcq_total)
+    scores = [results[q.id] for q in assessment.questions]
+    return _assemble(scores, feedback)
+
+async def _grade_owned(assessment, results, owned, shared, mcq_correct, mcq_total):
+    """
+    Grade one batch submission.  `owned` questions go to the LLM in this
+    submission's call and resolve their futures; `shared` ones wait for
+    the submission that owns the identical question/answer pair.
+    """
+    feedback = None
+    try:
+        if owned:
+            questions = [q for q, _ in owned]
+            async with _batch_slots:
+                raw = await _ask_llm(questions, mcq_correct, mcq_total)
+            try:
+                feedback = _apply_llm_grades(raw, questions, results)
+            except ModelOutputError as e:
+                raise HTTPException(status_code=500, detail=e.content)
+            if feedback:
+                _cache.put(_feedback_key(assessment), {"feedback": feedback})
+            for q, future in owned:
+                future.set_result(results[q.id])
+    except Exception as e:
+        for _, future in owned:
+            if not future.done():
+                future.set_exception(e)
+        raise
+    finally:
+        for _, future in owned:
+            future.cancel()             # no-op once resolved
+
+    for q, future in shared:
+        s = await asyncio.shield(future)
+        results[q.id] = {"id": q.id, "score": s["score"], "explanation": s["explanation"]}
+
+    feedback = feedback or _overall_feedback(assessment, results, mcq_correct, mcq_total)
+    return _assemble([results[q.id] for q in assessment.questions], feedback)
+
+async def _prepare_batch(assessments: List[AssessmentIn]):
+    """
+    Score locally, then give every distinct uncached question/answer pair
+    one owner submission.  Returns [(assessment id, coroutine), …].
+    """
+    loop = asyncio.get_running_loop()
+    owners = {}                         # cache key -> future of its graded result
+    jobs = []
+    for assessment in assessments:
+        results, pending, mcq_correct, mcq_total = _score_locally(assessment)
+        owned, shared = [], []
+        for q in pending:
+            key = _cache_key(q)
+            if key in owners:
+                shared.append((q, owners[key]))
+            else:
+                owners[key] = loop.create_future()
+                # failures surface per submission; don't also log them as unretrieved
+                owners[key].add_done_callback(lambda f: f.cancelled() or f.exception())
+                owned.append((q, owners[key]))
+        jobs.append((assessment.assessment_id,
+                     _grade_owned(assessment, results, owned, shared, mcq_correct, mcq_total)))
+    print(f"Batch of {len(assessments)} assessments: {len(owners)} distinct answers for the LLM.")
+    return jobs
+
+@app.post("/grade_batch")
+async def grade_batch(payload: AssessmentBatchIn):
+    """Grade many assessments; one NDJSON line per assessment as it finishes."""
+    batch.check_size(len(payload.submissions))
+    return await batch.stream_batch(_gate, lambda: _prepare_batch(payload.submissions))
+
+async def _run_grade_job(payload: dict) -> dict:
+    result = await grade(AssessmentIn(**payload))
+    if isinstance(result, JSONResponse):          # unusable model output
+        raise HTTPException(status_code=result.status_code, detail=json.loads(result.body))
+    return result
+
+# Asynchronous jobs (POST returns a job id, GET long-polls): see grader_common/jobs.py
+_jobs = JobQueue({"grade": _run_grade_job})
+
+@app.post("/jobs/grade", status_code=202)
+def submit_grade_job(assessment: AssessmentIn):
+    job = _jobs.submit("grade", assessment.model_dump())
+    return {"job_id": job["id"], "status": job["status"]}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, wait: float = 0):
+    return job_response(await _jobs.wait(job_id, wait))
+
+@app.get("/stats")
+def stats():
+    return {"admission": _gate.stats(), "cache": _cache.stats(), "jobs": _jobs.stats()}
+
+# nothing to warm here (no retrieval); both probes answer as soon as the port binds
+@app.get("/healthz")
+def healthz():
+    return {"status": "ok"}
 
+@app.get("/readyz")
+def readyz():
+    return {"ready": True}
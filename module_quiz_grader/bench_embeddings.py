@@ -0,0 +1,87 @@
+"""
+bench_embeddings.py
+─────────────────────────────────────────────────────────
+Compare the int8 ONNX embedding backend against the PyTorch one on our
+own data: every chunk in all_chunks_processed.csv is the corpus and
+every question stem in the quiz banks is a query.
+
+Reports per backend: model load time, corpus embedding time, single-
+query latency (p50 / p95), and recall@k of the ONNX top-k against the
+hf top-k (the ranking the current index was built with).
+
+Run:   python bench_embeddings.py [--k 3] [--runs 50]
+"""
+
+import argparse
+import csv
+import json
+import statistics
+from datetime import datetime
+from pathlib import Path
+import numpy as np
+from embeddings import load_embed_model
+
+CHUNKS_CSV = Path("../chunks_processed/all_chunks_processed.csv")
+BANK_DIR   = Path("module_quiz_question_bank")
+
+
+def load_corpus():
+    with open(CHUNKS_CSV, encoding="utf-8") as f:
+        texts = [row["text"] for row in csv.DictReader(f)]
+    stems = []
+    for bank_file in sorted(BANK_DIR.glob("*/*.json")):
+        with open(bank_file, encoding="utf-8") as f:
+            stems.extend(q["stem"] for q in json.load(f)["questions"])
+    return texts, stems
+
+
+def seconds_since(start_time):
+    return (datetime.now() - start_time).total_seconds()
+
+
+def bench(backend, texts, stems, k, runs):
+    start_time = datetime.now()
+    model = load_embed_model(backend)
+    load_s = seconds_since(start_time)
+
+    start_time = datetime.now()
+    corpus = np.asarray(model._get_text_embeddings(texts), dtype=np.float32)
+    corpus_s = seconds_since(start_time)
+
+    latencies = []
+    for stem in (stems * (runs // max(len(stems), 1) + 1))[:runs]:
+        start_time = datetime.now()
+        model.get_query_embedding(stem)
+        latencies.append(seconds_since(start_time) * 1000)
+
+    queries = np.asarray(model._get_text_embeddings(stems), dtype=np.float32)
+    top = np.argsort(-(queries @ corpus.T), axis=1)[:, :k]
+    return {"load_s": load_s, "corpus_s": corpus_s,
+            "p50_ms": statistics.median(latencies),
+            "p95_ms": sorted(latencies)[int(0.95 * (len(latencies) - 1))],
+            "top": top, "queries": queries}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark hf vs onnx embeddings.")
+    parser.add_argument("--k", type=int, default=3, help="recall@k cut-off")
+    parser.add_argument("--runs", type=int, default=50, help="single-query latency samples")
+    args = parser.parse_args()
+
+    texts, stems = load_corpus()
+    print(f"{len(texts)} chunks, {len(stems)} questions\n")
+    results = {backend: bench(backend, texts, stems, args.k, args.runs) for backend in ("hf", "onnx")}
+
+    reference, candidate = results["hf"]["top"], results["onnx"]["top"]
+    recall = np.mean([len(set(r) & set(c)) / args.k for r, c in zip(reference, candidate)])
+    agreement = np.mean(np.sum(results["hf"]["queries"] * results["onnx"]["queries"], axis=1))
+
+    print(f"\n{'backend':<8}{'load s':>9}{'corpus s':>10}{'p50 ms':>9}{'p95 ms':>9}")
+    for backend, r in results.items():
+        print(f"{backend:<8}{r['load_s']:>9.2f}{r['corpus_s']:>10.2f}{r['p50_ms']:>9.1f}{r['p95_ms']:>9.1f}")
+    print(f"\nrecall@{args.k} of onnx vs hf: {recall:.3f}")
+    print(f"mean cosine(hf, onnx) of query vectors: {agreement:.4f}")
+
+
+if __name__ == "__main__":
+    main()
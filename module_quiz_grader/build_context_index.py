@@ -0,0 +1,65 @@
+"""
+build_context_index.py
+─────────────────────────────────────────────────────────
+Run after embed.py.  Resolves the top-k context chunks for every
+question id in every module quiz bank and writes them to a compact
+JSON index, so the grader can attach context with a dictionary
+lookup instead of embedding + querying on each submission.
+
+Index layout:
+    {"top_k": 3,
+     "questions": {"<question id>": ["<chunk id>", …]},
+     "chunks":    {"<chunk id>": "<chunk text>"}}
+
+Run:   python build_context_index.py [top_k]
+"""
+
+import json, os, sys
+from datetime import datetime
+from pathlib import Path
+from retriever import DocumentRetriever
+
+DB_PATH    = r"../chroma_db"
+BANK_DIR   = Path("module_quiz_question_bank")
+INDEX_PATH = Path(DB_PATH) / "context_index.json"
+RERANK_MODEL = os.getenv("ICAT_RERANK_MODEL")   # same reranking as the grader
+VECTOR_BACKEND = os.getenv("ICAT_VECTOR_BACKEND", "chroma")
+HYBRID = os.getenv("ICAT_HYBRID_RETRIEVAL", "1") == "1"
+
+
+def build_index(rtr: DocumentRetriever, top_k: int) -> dict:
+    questions, chunks = {}, {}
+    for bank_file in sorted(BANK_DIR.glob("*/*.json")):
+        with open(bank_file, encoding="utf-8") as f:
+            quiz = json.load(f)
+
+        # same module filter as _retrieve_hits
+        module = quiz["module_code"] if rtr.has_module(quiz["module_code"]) else None
+
+        stems = [q["stem"] for q in quiz["questions"]]
+        all_hits = rtr.retrieve_many(stems, top_k=top_k, module=module, rerank=bool(RERANK_MODEL),
+                                     hybrid=HYBRID)
+        if isinstance(all_hits, str):
+            print(f"Skipping {bank_file}: {all_hits}")
+            continue
+
+        for q, hits in zip(quiz["questions"], all_hits):
+            questions[q["id"]] = [h["id"] for h in hits]
+            chunks.update({h["id"]: h["text"] for h in hits})
+        print(f"Indexed {len(stems)} questions from {bank_file.name} (module filter: {module})")
+
+    return {"top_k": top_k, "built_at": datetime.now().isoformat(),
+            "questions": questions, "chunks": chunks}
+
+
+def main():
+    top_k = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    index = build_index(DocumentRetriever(db_path=DB_PATH, rerank_model_path=RERANK_MODEL,
+                                         backend=VECTOR_BACKEND), top_k)
+    INDEX_PATH.write_text(json.dumps(index, ensure_ascii=False), encoding="utf-8")
+    print(f"Saved context for {len(index['questions'])} questions "
+          f"({len(index['chunks'])} chunks) → {INDEX_PATH}")
+
+
+if __name__ == "__main__":
+    main()
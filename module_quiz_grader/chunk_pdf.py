@@ -1,41 +1,327 @@
-import pypdf, pandas as pd, textwrap, os, re, sys
+import pypdf, csv, json, os, re, sys, argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from datetime import datetime
 
+# "words" strategy: fixed sliding windows
 CHUNK_LEN = 50  # words per chunk
 OVERLAP = 20
 
+# "sentences" strategy (default): whole sentences packed up to MAX_TOKENS
+# tokenizer tokens, a new chunk at every heading, OVERLAP_SENTENCES carried over
+MAX_TOKENS = 256
+OVERLAP_SENTENCES = 1
+TOKENIZER_PATH = os.getenv("ICAT_EMBED_MODEL", "D:/bge-m3/bge-m3")
 
-def pdf_to_chunks(pdf_path: Path, module_code: str):
-    reader = pypdf.PdfReader(str(pdf_path))
-    full_text = "\n".join(page.extract_text() or "" for page in reader.pages)
-    words = full_text.split()
-    chunks = []
-    idx = 0
-    chunk_num = 0  # Add a separate counter for chunk IDs
+OUT_DIR = Path("chunks_processed")
+ALL_CHUNKS_CSV = OUT_DIR / "all_chunks_processed.csv"
 
-    while idx < len(words):
-        chunk_words = words[idx: idx + CHUNK_LEN]
-        chunk_text = " ".join(chunk_words)
-        chunk_id = f"{module_code}_{chunk_num:04d}"  # Use chunk_num instead
-        chunks.append({"id": chunk_id, "text": chunk_text})
-        idx += CHUNK_LEN - OVERLAP
-        chunk_num += 1  # Increment the chunk counter
+# Batch mode reads Modules/<folder>/<folder>.pdf, with the module code taken
+# from the folder's "<folder> Questions.json" (the quiz's module_code)
+PAGES_PER_TASK = 4  # most pages extracted per worker task
+
+
+def _extract_pages(task):
+    """Worker: extract the text of pages [start, stop) of one PDF."""
+    pdf_path, start, stop = task
+    reader = pypdf.PdfReader(pdf_path)
+    return [reader.pages[i].extract_text() or "" for i in range(start, stop)]
+
+
+def _bounded_map(pool, fn, tasks, window):
+    """Like pool.map, in order, but with at most `window` tasks in flight."""
+    pending = deque()
+    for task in tasks:
+        pending.append(pool.submit(fn, task))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def page_tasks(pdf_path: Path, pages_per_task=PAGES_PER_TASK):
+    """(pdf, start, stop) extraction tasks covering every page of one PDF."""
+    n_pages = len(pypdf.PdfReader(str(pdf_path)).pages)
+    return [(str(pdf_path), start, min(start + pages_per_task, n_pages))
+            for start in range(0, n_pages, pages_per_task)]
+
+
+def iter_page_texts(pdf_path: Path, pool=None, window=8):
+    """Yield the text of each page in order, extracted in the pool if given."""
+    tasks = page_tasks(pdf_path)
+    results = _bounded_map(pool, _extract_pages, tasks, window) if pool else map(_extract_pages, tasks)
+    for page_texts in results:
+        yield from page_texts
+
+
+def iter_chunks(pages, module_code: str):
+    """
+    Sliding CHUNK_LEN-word windows with OVERLAP, fed page by page; only the
+    words of the current window are kept.  Produces the same chunks as
+    splitting the whole document at once.
+    """
+    step = CHUNK_LEN - OVERLAP
+    words = []
+    chunk_num = 0
+    for text in pages:
+        words.extend(text.split())
+        while len(words) >= CHUNK_LEN:
+            yield {"id": f"{module_code}_{chunk_num:04d}", "text": " ".join(words[:CHUNK_LEN])}
+            del words[:step]
+            chunk_num += 1
+    while words:
+        yield {"id": f"{module_code}_{chunk_num:04d}", "text": " ".join(words[:CHUNK_LEN])}
+        del words[:step]
+        chunk_num += 1
+
+
+# ─── sentence / token chunker ─────────────────────────
+_SENTENCE = re.compile(r'\S.*?(?:[.!?]+["”’)\]]*(?=\s|$)|$)', re.S)
+_WORD     = re.compile(r'\S+')
+
+
+def load_token_counter(tokenizer_path=TOKENIZER_PATH):
+    """
+    Count tokens with the embedding model's tokenizer; fall back to a
+    words × 1.3 estimate when transformers or the model files are missing.
+    """
+    try:
+        from transformers import AutoTokenizer
+        tokenizer = AutoTokenizer.from_pretrained(tokenizer_path)
+        print(f"Counting tokens with the tokenizer at {tokenizer_path}")
+        return lambda text: len(tokenizer.encode(text, add_special_tokens=False))
+    except Exception as e:
+        print(f"Tokenizer unavailable ({e}); estimating tokens from word counts")
+        return lambda text: int(len(text.split()) * 1.3) + 1
+
+
+def _is_heading(line: str) -> bool:
+    words = line.split()
+    return 0 < len(words) <= 8 and line[-1] not in ".!?,;:" and (line[0].isupper() or line[0].isdigit())
+
+
+def _ends_sentence(line: str) -> bool:
+    return line.rstrip("\"')]\u201d\u2019")[-1:] in (".", "!", "?")
+
+
+def iter_units(page_no: int, text: str):
+    """
+    Yield sentences and headings of one page as
+    {"text", "page", "start", "end", "heading"} (offsets into the page text).
+    """
+    paragraph_start = paragraph_end = None
+
+    def sentences(start, end):
+        for m in _SENTENCE.finditer(text, start, end):
+            yield {"text": " ".join(m.group().split()), "page": page_no,
+                   "start": m.start(), "end": m.end(), "heading": False}
+
+    # a short capitalised line is only a heading at a boundary: page start, after
+    # a blank line, a heading or a finished sentence; otherwise it is a wrapped line
+    boundary, previous_end = True, 0
+    for line in re.finditer(r'[^\n]+', text):
+        stripped = line.group().strip()
+        if not stripped:
+            boundary = True
+            continue
+        if text.count("\n", previous_end, line.start()) > 1:
+            boundary = True
+        previous_end = line.end()
+        if boundary and _is_heading(stripped):
+            if paragraph_start is not None:
+                yield from sentences(paragraph_start, paragraph_end)
+                paragraph_start = None
+            yield {"text": stripped, "page": page_no, "start": line.start(),
+                   "end": line.end(), "heading": True}
+        else:
+            if paragraph_start is None:
+                paragraph_start = line.start()
+            paragraph_end = line.end()
+            boundary = _ends_sentence(stripped)
+    if paragraph_start is not None:
+        yield from sentences(paragraph_start, paragraph_end)
+
+
+def _split_long(unit, page_text, count_tokens, max_tokens):
+    """Cut a sentence longer than max_tokens into word runs that fit."""
+    words = list(_WORD.finditer(page_text, unit["start"], unit["end"]))
+    per_piece = max(1, len(words) * max_tokens // max(count_tokens(unit["text"]), 1))
+    for i in range(0, len(words), per_piece):
+        piece = words[i:i + per_piece]
+        yield {"text": " ".join(w.group() for w in piece), "page": unit["page"],
+               "start": piece[0].start(), "end": piece[-1].end(), "heading": False}
+
+
+def iter_sentence_chunks(pages, module_code: str, count_tokens,
+                         max_tokens=MAX_TOKENS, overlap=OVERLAP_SENTENCES):
+    """
+    Pack sentences into chunks of at most max_tokens tokens, never splitting
+    a sentence unless it alone is too long, and starting a new chunk at each
+    heading.  Each chunk records its first/last page and character offsets.
+    """
+    chunk, tokens, fresh = [], 0, 0    # fresh = units not carried over as overlap
+    chunk_num = 0
+
+    def flush():
+        nonlocal chunk_num
+        first, last = chunk[0], chunk[-1]
+        row = {"id": f"{module_code}_{chunk_num:04d}", "text": " ".join(u["text"] for u in chunk),
+               "page": first["page"], "char_start": first["start"],
+               "page_end": last["page"], "char_end": last["end"]}
+        chunk_num += 1
+        return row
+
+    for page_no, page_text in enumerate(pages, start=1):
+        for unit in iter_units(page_no, page_text):
+            unit_tokens = count_tokens(unit["text"])
+            pieces = [unit] if unit_tokens <= max_tokens else \
+                list(_split_long(unit, page_text, count_tokens, max_tokens))
+
+            for piece in pieces:
+                piece_tokens = unit_tokens if piece is unit else count_tokens(piece["text"])
+                if fresh and (unit["heading"] or tokens + piece_tokens > max_tokens):
+                    yield flush()
+                    chunk = chunk[-overlap:] if overlap else []
+                    tokens, fresh = sum(count_tokens(u["text"]) for u in chunk), 0
+                if unit["heading"] or tokens + piece_tokens > max_tokens:
+                    chunk, tokens = [], 0       # no overlap across a heading
+                chunk.append(piece)
+                tokens += piece_tokens
+                fresh += 1
+    if fresh:
+        yield flush()
+
+
+def make_chunker(strategy="sentences", max_tokens=MAX_TOKENS, overlap=OVERLAP_SENTENCES,
+                 tokenizer_path=TOKENIZER_PATH):
+    """Return chunker(pages, module_code) -> generator of chunk rows."""
+    if strategy == "words":
+        return iter_chunks
+    count_tokens = load_token_counter(tokenizer_path)
+    return lambda pages, module_code: iter_sentence_chunks(
+        pages, module_code, count_tokens, max_tokens, overlap)
+
+
+def pdf_to_chunks(pdf_path: Path, module_code: str, pool=None, chunker=None):
+    """Generator of chunk rows for one PDF."""
+    return (chunker or make_chunker())(iter_page_texts(pdf_path, pool), module_code)
+
+
+FIELDS = {"words": ["id", "text"],
+          "sentences": ["id", "text", "page", "char_start", "page_end", "char_end"]}
+
+
+def _writer(fh, strategy):
+    writer = csv.DictWriter(fh, fieldnames=FIELDS[strategy], lineterminator="\n")
+    writer.writeheader()
+    return writer
+
+
+def module_code(folder: Path):
+    """The module_code of the folder's question bank, or None."""
+    try:
+        with open(folder / f"{folder.name} Questions.json", encoding="utf-8") as f:
+            return json.load(f).get("module_code")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def find_modules(modules_dir: Path):
+    """(module code, pdf path) for every module folder with a PDF and a question bank."""
+    for folder in sorted(p for p in modules_dir.iterdir() if p.is_dir()):
+        code = module_code(folder)
+        pdf_path = folder / f"{folder.name}.pdf"
+        if code is None:
+            print(f"Skipping '{folder.name}': no module_code in '{folder.name} Questions.json'")
+        elif not pdf_path.exists():
+            print(f"Skipping '{folder.name}': {pdf_path.name} not found")
+        else:
+            yield code, pdf_path
+
+
+def chunk_all(modules_dir: Path, workers=None, strategy="sentences", chunker=None):
+    """
+    Chunk every module PDF and write the per-module CSVs and the combined
+    CSV in one pass (replaces the separate concat step).
+
+    The page-range tasks of all modules go through one pool queue, split
+    finely enough to give every worker pages, so extraction of the next
+    modules runs while the current one is chunked; results are consumed
+    in order and grouped back by module.
+    """
+    OUT_DIR.mkdir(exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    modules = list(find_modules(modules_dir))
+    total_pages = sum(len(pypdf.PdfReader(str(pdf_path)).pages) for _, pdf_path in modules)
+    pages_per_task = max(1, min(PAGES_PER_TASK, -(-total_pages // workers)))
+    tasks = [(code, page_tasks(pdf_path, pages_per_task)) for code, pdf_path in modules]
+
+    total = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool, \
+            open(ALL_CHUNKS_CSV, "w", newline="", encoding="utf-8") as all_fh:
+        all_writer = _writer(all_fh, strategy)
+        results = _bounded_map(pool, _extract_pages,
+                               [task for _, module_tasks in tasks for task in module_tasks],
+                               window=2 * workers)
+        for code, module_tasks in tasks:
+            out_csv = OUT_DIR / f"{code}_chunks.csv"
+            count = 0
+            with open(out_csv, "w", newline="", encoding="utf-8") as fh:
+                writer = _writer(fh, strategy)
+                pages = [text for _ in module_tasks for text in next(results)]
+                for chunk in (chunker or make_chunker(strategy))(pages, code):
+                    writer.writerow(chunk)
+                    all_writer.writerow(chunk)
+                    count += 1
+            total += count
+            print(f"Saved {count} chunks → {out_csv}")
+    print(f"Wrote {total} rows to {ALL_CHUNKS_CSV} (UTF-8)")
 
-    return pd.DataFrame(chunks)
 
 def main():
-    pdf_path = Path(sys.argv[1]).resolve()
-    module_code = sys.argv[2]           # e.g. PH01
-    out_csv = Path("chunks_processed") / f"{module_code}_chunks.csv"
-    out_csv.parent.mkdir(exist_ok=True)
-    df = pdf_to_chunks(pdf_path, module_code)
-    df.to_csv(out_csv, index=False)
-    print(f"Saved {len(df)} chunks → {out_csv}")
+    parser = argparse.ArgumentParser(description="Split module PDFs into retrieval chunks.")
+    parser.add_argument("pdf", nargs="?", help="single PDF to chunk")
+    parser.add_argument("module_code", nargs="?", help="module code for the single PDF, e.g. PH01")
+    parser.add_argument("--all", metavar="MODULES_DIR",
+                        help="chunk every module under this directory (e.g. Modules)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="page-extraction processes (default: all cores)")
+    parser.add_argument("--strategy", choices=["sentences", "words"], default="sentences",
+                        help="sentence/token-sized chunks, or fixed %d-word windows" % CHUNK_LEN)
+    parser.add_argument("--max-tokens", type=int, default=MAX_TOKENS,
+                        help="token budget per chunk (sentences strategy)")
+    parser.add_argument("--overlap-sentences", type=int, default=OVERLAP_SENTENCES,
+                        help="sentences repeated at the start of the next chunk")
+    parser.add_argument("--tokenizer", default=TOKENIZER_PATH,
+                        help="tokenizer used to count tokens (default: the embedding model)")
+    args = parser.parse_args()
+
+    chunker = make_chunker(args.strategy, args.max_tokens, args.overlap_sentences, args.tokenizer)
+
+    start_time = datetime.now()
+    if args.all:
+        chunk_all(Path(args.all).resolve(), args.workers, args.strategy, chunker)
+    elif args.pdf and args.module_code:
+        pdf_path = Path(args.pdf).resolve()
+        out_csv = OUT_DIR / f"{args.module_code}_chunks.csv"
+        out_csv.parent.mkdir(exist_ok=True)
+        count = 0
+        with open(out_csv, "w", newline="", encoding="utf-8") as fh:
+            writer = _writer(fh, args.strategy)
+            for chunk in pdf_to_chunks(pdf_path, args.module_code, chunker=chunker):
+                writer.writerow(chunk)
+                count += 1
+        print(f"Saved {count} chunks → {out_csv}")
+    else:
+        parser.print_usage()
+        sys.exit(1)
+    print(f"Chunking took {(datetime.now() - start_time).total_seconds():.2f} seconds.")
 
 if __name__ == "__main__":
     """
     Example:
         python chunk_pdf.py "Phishing 101.pdf" PH01
+        python module_quiz_grader/chunk_pdf.py --all Modules     # whole curriculum
     """
     main()
@@ -0,0 +1,115 @@
+"""
+context_budget.py
+─────────────────────────────────────────────────────────
+Turns retrieved chunks into the '### Context' passages of a quiz:
+
+  • adjacent / overlapping chunks (PW01_0003 + PW01_0004, which share
+    their overlap words or sentence) are merged into one passage;
+  • a chunk already given to an earlier question is not repeated;
+  • passages are trimmed to a token budget per question and, when all
+    questions share one prompt, per request.
+
+Prompt length drives Ollama prefill time, so every repeated sentence
+cut here is latency saved.
+"""
+
+import os, re
+from typing import List
+
+PER_QUESTION_TOKENS = int(os.getenv("ICAT_CONTEXT_TOKENS_PER_QUESTION", "400"))
+PER_REQUEST_TOKENS  = int(os.getenv("ICAT_CONTEXT_TOKENS_PER_REQUEST", "1500"))
+MIN_TRIMMED_TOKENS  = 32          # don't bother with a passage cut shorter than this
+MAX_OVERLAP_WORDS   = 80
+
+_CHUNK_ID = re.compile(r"^(.*)_(\d+)$")
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (same words × 1.3 rule as chunk_pdf's fallback)."""
+    return int(len(text.split()) * 1.3) + 1
+
+
+def _merge_text(first: str, second: str) -> str:
+    """Join two neighbouring chunks, dropping the words they share."""
+    a, b = first.split(), second.split()
+    for n in range(min(len(a), len(b), MAX_OVERLAP_WORDS), 0, -1):
+        if a[-n:] == b[:n]:
+            return " ".join(a + b[n:])
+    return " ".join(a + b)
+
+
+def merge_hits(hits: List[dict]) -> List[dict]:
+    """
+    Merge runs of consecutive chunk ids into single passages.
+
+    Args:
+        hits (list): {"id", "text"} dicts in relevance order
+
+    Returns:
+        list: {"ids", "text"} passages, ordered by their best-ranked chunk
+    """
+    ranked = []
+    for rank, hit in enumerate(hits):
+        m = _CHUNK_ID.match(hit["id"])
+        key = (m.group(1), int(m.group(2))) if m else (hit["id"], -1)
+        ranked.append((key, rank, hit))
+    ranked.sort(key=lambda r: r[0])
+
+    passages = []
+    for (prefix, num), rank, hit in ranked:
+        last = passages[-1] if passages else None
+        if last and num >= 0 and last["prefix"] == prefix and last["num"] == num - 1:
+            last["text"] = _merge_text(last["text"], hit["text"])
+            last["ids"].append(hit["id"])
+            last["num"] = num
+            last["rank"] = min(last["rank"], rank)
+        else:
+            passages.append({"prefix": prefix, "num": num, "rank": rank,
+                             "ids": [hit["id"]], "text": hit["text"]})
+    passages.sort(key=lambda p: p["rank"])
+    return [{"ids": p["ids"], "text": p["text"]} for p in passages]
+
+
+def _trim(text: str, max_tokens: int) -> str:
+    words = text.split()
+    keep = max(1, int(max_tokens / 1.3) - 1)
+    return " ".join(words[:keep]) + (" …" if keep < len(words) else "")
+
+
+def assemble_context(hits_per_question: List[List[dict]], per_question=PER_QUESTION_TOKENS,
+                     per_request=PER_REQUEST_TOKENS, dedupe=True) -> List[List[str]]:
+    """
+    Build the context passages for every question of one request.
+
+    Args:
+        hits_per_question (list): For each question, its {"id", "text"} hits in relevance order
+        per_question (int): Token budget for one question's context
+        per_request (int): Token budget for all contexts of the request together,
+                           or None when every question is its own prompt
+        dedupe (bool): Skip chunks already used by an earlier question (set this
+                       when all questions share one prompt)
+
+    Returns:
+        list: For each question, the passage texts to attach
+    """
+    per_request = float("inf") if per_request is None else per_request
+    seen, used, out = set(), 0, []
+    for hits in hits_per_question:
+        if dedupe:
+            hits = [h for h in hits if h["id"] not in seen]
+        chosen, q_used = [], 0
+        for passage in merge_hits(hits):
+            left = min(per_question - q_used, per_request - used)
+            tokens = estimate_tokens(passage["text"])
+            text = passage["text"]
+            if tokens > left:
+                if left < MIN_TRIMMED_TOKENS:
+                    break
+                text = _trim(text, left)
+                tokens = estimate_tokens(text)
+            chosen.append(text)
+            seen.update(passage["ids"])
+            q_used += tokens
+            used += tokens
+        out.append(chosen)
+    return out
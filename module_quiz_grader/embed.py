@@ -1,12 +1,48 @@
 import pandas as pd
 import chromadb
-from llama_index.vector_stores.chroma import ChromaVectorStore
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
-from llama_index.core.schema import Document
 from datetime import datetime
-import numpy as np
+from collections import defaultdict
+from contextlib import contextmanager
+import argparse
+import hashlib
+import json
 import os
-import glob
+from vector_backends import export_numpy_index
+from lexical_index import build_index as build_lexical_index
+from embeddings import EMBED_BACKEND, embedding_id, load_embed_model
+
+# Incremental, streaming indexer: every chunk is stored with a hash of its
+# text, so a run only embeds new or changed chunks, upserts them, and
+# deletes chunks that disappeared from the CSVs.  The CSV is read, embedded
+# and written batch by batch, so peak memory depends on the batch size and
+# not on the corpus size; a checkpoint file lets an interrupted run resume.
+# Collections are never dropped, so the retriever keeps serving meanwhile.
+#
+# Every vector is written once, to 'all_projects'; per-module retrieval uses
+# its `module` metadata (where={"module": code}) instead of project_* copies.
+#
+# After a change the collection is also exported as a memory-mapped NumPy
+# index (chroma_db/numpy_index) for ICAT_VECTOR_BACKEND=numpy, and the BM25
+# inverted index (chroma_db/lexical_index.json) for hybrid retrieval is rebuilt.
+#
+# The embedding runtime (PyTorch or int8 ONNX) comes from embeddings.py
+# (ICAT_EMBED_BACKEND / ICAT_EMBED_MODEL).  Each chunk records the runtime
+# that embedded it (`embedding` metadata), and chunks from another runtime
+# count as changed, so a switch re-embeds them on the next run.  Use
+# --reembed after replacing a model in place (same directory name).
+#
+# Run:   python module_quiz_grader/embed.py [--batch-size 64] [--threads 4] [--fresh]
+#                                           [--reembed] [--numpy-dtype float16|float32|none]
+
+DB_PATH = "./chroma_db"
+NUMPY_INDEX_DIR = os.path.join(DB_PATH, "numpy_index")
+LEXICAL_INDEX_FILE = os.path.join(DB_PATH, "lexical_index.json")
+ALL_CHUNKS_FILE = 'chunks_processed/all_chunks_processed.csv'
+CHECKPOINT_FILE = os.path.join(DB_PATH, ".embed_checkpoint.json")
+BATCH_SIZE = 64
+EMBED_THREADS = None
+# chunks indexed before the `embedding` metadata existed were embedded by the hf default
+LEGACY_EMBEDDING = embedding_id("hf")
 
 
 def calc_and_print_time(start_time, name):
@@ -17,122 +53,235 @@ def calc_and_print_time(start_time, name):
     print(f"{name} time: {int(minutes)} minutes and {seconds:.2f} seconds.")
 
 
-# Initialize Chroma client
-chroma_client = chromadb.PersistentClient(path="./chroma_db")
-
-# Initialize the embedding model
-print("Initializing embedding model...")
-embed_model = HuggingFaceEmbedding(r"D:\bge-m3\bge-m3")
-
-# Path to the all chunks processed file
-all_chunks_file = 'chunks_processed/all_chunks_processed.csv'
-
-# Load the all chunks processed CSV file
-print(f"Loading data from {all_chunks_file}...")
-all_data = pd.read_csv(all_chunks_file)
-print(f"Loaded {len(all_data)} documents from {all_chunks_file}")
-
-# Generate embeddings for all chunks at once
-print("Generating embeddings for all documents...")
-start_embedding = datetime.now()
-
-# Extract text from the data
-texts = all_data['text'].tolist()
-ids = all_data['id'].astype(str).tolist()
-
-# Generate embeddings for all texts at once
-embeddings = embed_model._get_text_embeddings(texts)
-
-calc_and_print_time(start_embedding, "Embedding generation")
-print(f"Generated embeddings for {len(embeddings)} documents")
-
-# Create a dictionary mapping IDs to their embeddings and texts for quick lookup
-print("Creating lookup tables for efficient collection creation...")
-id_to_embedding = {id_val: embedding for id_val, embedding in zip(ids, embeddings)}
-id_to_text = {id_val: text for id_val, text in zip(ids, texts)}
-
-# --- drop & recreate 'all_projects' every run ------------
-try:
-    chroma_client.delete_collection("all_projects")
-except Exception as e:
-    print(f"Warning: Could not delete 'all_projects' collection. Reason: {e}")
-
-# First, create and populate the "all_projects" collection
-print("\nCreating 'all_projects' collection...")
-all_projects_collection = chroma_client.get_or_create_collection("all_projects")
-
-# Add documents in batches to avoid memory issues
-batch_size = 1000
-for i in range(0, len(ids), batch_size):
-    batch_ids = ids[i:i + batch_size]
-    batch_texts = [id_to_text[id_val] for id_val in batch_ids]
-    batch_embeddings = [id_to_embedding[id_val] for id_val in batch_ids]
-
-    all_projects_collection.add(
-        documents=batch_texts,
-        ids=batch_ids,
-        embeddings=batch_embeddings,
-        metadatas=[{"module": id_val.split("_")[0]} for id_val in batch_ids]
-    )
-    print(f"Added batch {i // batch_size + 1}/{(len(ids) - 1) // batch_size + 1} to all_projects collection")
-
-# Now create collections for each project
-project_files = glob.glob('chunks_processed/*_chunks.csv')
-print(f"\nFound {len(project_files)} project files to create collections for")
-
-for project_file in project_files:
-    # Extract the project name from the filename
-    project_name = os.path.basename(project_file).replace('_chunks.csv', '')
-    print(f"\nProcessing project: {project_name}")
-
-    # # --- (re)create collection fresh ---
-    # coll_name = f"project_{project_name}"
-    # chroma_client.delete_collection(coll_name)  # ignore if not present
-    # project_collection = chroma_client.create_collection(coll_name)
-
-    # Load the project's CSV file
-    project_data = pd.read_csv(project_file)
-    project_ids = project_data['id'].astype(str).tolist()
-    print(f"Loaded {len(project_data)} documents for project {project_name}")
-
-    # Create a collection for the project
-    # Delete the collection if it exists
-    collection_name = f"project_{project_name}"
+# seconds spent per build phase, summed over all batches
+phase_seconds = defaultdict(float)
+
+
+@contextmanager
+def phase(name):
+    start_time = datetime.now()
+    try:
+        yield
+    finally:
+        phase_seconds[name] += (datetime.now() - start_time).total_seconds()
+
+
+def print_phase_times():
+    for name, seconds in phase_seconds.items():
+        minutes, seconds = divmod(seconds, 60)
+        print(f"{name} time: {int(minutes)} minutes and {seconds:.2f} seconds.")
+
+
+def content_hash(text):
+    """Stable fingerprint of a chunk's text."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def stored_hashes(collection, ids=None):
+    """Map chunk id -> (content hash, embedding id) for `ids` (or everything) already stored."""
+    stored = collection.get(ids=ids, include=["metadatas"])
+    return {id_val: ((meta or {}).get("content_hash"), (meta or {}).get("embedding", LEGACY_EMBEDDING))
+            for id_val, meta in zip(stored["ids"], stored["metadatas"])}
+
+
+def stored_ids(collection):
+    """Yield every id in the collection, page by page."""
+    offset = 0
+    while True:
+        page = collection.get(include=[], limit=BATCH_SIZE, offset=offset)["ids"]
+        if not page:
+            return
+        yield from page
+        offset += len(page)
+
+
+def chunk_metadata(id_val, text_hash, embedding, page=None):
+    metadata = {"module": id_val.split("_")[0], "content_hash": text_hash, "embedding": embedding}
+    if page is not None and not pd.isna(page):
+        metadata["page"] = int(page)
+    return metadata
+
+
+def delete_in_batches(collection, ids):
+    for i in range(0, len(ids), BATCH_SIZE):
+        collection.delete(ids=ids[i:i + BATCH_SIZE])
+    if ids:
+        print(f"Deleted {len(ids)} stale chunks from {collection.name}")
+
+
+_embed_model = None
+
+
+def get_embed_model():
+    """Load bge-m3 on first use, so an up-to-date index never loads it."""
+    global _embed_model
+    if _embed_model is None:
+        print("Initializing embedding model...")
+        _embed_model = load_embed_model(embed_batch_size=BATCH_SIZE, threads=EMBED_THREADS)
+    return _embed_model
+
+
+# ─── checkpointing ─────────────────────────────────────
+def _csv_signature(path):
+    st = os.stat(path)
+    return {"csv": os.path.abspath(path), "size": st.st_size, "mtime": st.st_mtime_ns}
+
+
+def load_checkpoint(path):
+    """Rows already written for this exact CSV, 0 if none/stale."""
     try:
-        chroma_client.delete_collection(collection_name)
-    except Exception:
-        pass  # Collection doesn't exist, that's fine
-
-    # Create a fresh collection
-    project_collection = chroma_client.create_collection(collection_name)
-
-    # Use the embeddings we already generated to populate the project collection
-    project_texts = []
-    project_embeddings = []
-    valid_ids = []
-
-    for proj_id in project_ids:
-        if proj_id in id_to_embedding:
-            valid_ids.append(proj_id)
-            project_texts.append(id_to_text[proj_id])
-            project_embeddings.append(id_to_embedding[proj_id])
-        else:
-            print(f"Warning: ID {proj_id} not found in all_chunks_processed data")
-
-    # Add documents in batches
-    for i in range(0, len(valid_ids), batch_size):
-        batch_ids = valid_ids[i:i + batch_size]
-        batch_texts = project_texts[i:i + batch_size]  # Slice from prepared list
-        batch_embeddings = project_embeddings[i:i + batch_size]  # Slice from prepared list
-
-        project_collection.add(
-            documents=batch_texts,
-            ids=batch_ids,
-            embeddings=batch_embeddings
-        )
-        print(
-            f"Added batch {i // batch_size + 1}/{(len(valid_ids) - 1) // batch_size + 1} to {project_name} collection")
-
-    print(f"Created collection 'project_{project_name}' with {len(valid_ids)} documents")
-
-print("\nAll collections created successfully!")
\ No newline at end of file
+        with open(CHECKPOINT_FILE, encoding="utf-8") as f:
+            checkpoint = json.load(f)
+    except (OSError, ValueError):
+        return 0
+    if {k: checkpoint.get(k) for k in ("csv", "size", "mtime")} != _csv_signature(path):
+        return 0
+    return checkpoint.get("rows_done", 0)
+
+
+def save_checkpoint(path, rows_done):
+    tmp = CHECKPOINT_FILE + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({**_csv_signature(path), "rows_done": rows_done}, f)
+    os.replace(tmp, CHECKPOINT_FILE)
+
+
+def clear_checkpoint():
+    try:
+        os.remove(CHECKPOINT_FILE)
+    except OSError:
+        pass
+
+
+# ─── collection sync ───────────────────────────────────
+def sync_all_projects(chroma_client, csv_path, resume_from=0, reembed=False):
+    """
+    Stream the CSV into 'all_projects' batch by batch: embed only new/changed
+    chunks (or all of them with reembed), upsert them right away, checkpoint,
+    then delete chunks that are gone.  A chunk embedded by another runtime
+    than the current one counts as changed.
+
+    Returns:
+        int: number of chunks upserted or deleted
+    """
+    collection = chroma_client.get_or_create_collection("all_projects")
+    current = embedding_id()
+    seen_ids = set()
+    changes = rows_done = 0
+    if resume_from:
+        print(f"Resuming after row {resume_from} (checkpoint)")
+
+    batches = pd.read_csv(csv_path, chunksize=BATCH_SIZE)
+    while True:
+        with phase("Read + hash"):
+            batch = next(batches, None)
+            if batch is None:
+                break
+            ids = batch['id'].astype(str).tolist()
+            texts = batch['text'].tolist()
+            hashes = [content_hash(text) for text in texts]
+            # sentence-strategy CSVs (chunk_pdf.py) also carry page numbers
+            pages = batch['page'].tolist() if 'page' in batch.columns else None
+        seen_ids.update(ids)
+        rows_done += len(ids)
+        if rows_done <= resume_from:
+            continue                    # already written before the interruption
+
+        with phase("Compare"):
+            stored = stored_hashes(collection, ids)
+            changed = [i for i, id_val in enumerate(ids)
+                       if reembed or stored.get(id_val) != (hashes[i], current)]
+        if changed:
+            changed_texts = [texts[i] for i in changed]
+            with phase("Embedding generation"):
+                embeddings = get_embed_model()._get_text_embeddings(changed_texts)
+            with phase("Write"):
+                collection.upsert(
+                    ids=[ids[i] for i in changed],
+                    documents=changed_texts,
+                    embeddings=embeddings,
+                    metadatas=[chunk_metadata(ids[i], hashes[i], current, pages[i] if pages else None)
+                               for i in changed]
+                )
+            print(f"Rows {rows_done - len(ids) + 1}-{rows_done}: embedded {len(changed)}")
+            changes += len(changed)
+        save_checkpoint(csv_path, rows_done)
+
+    with phase("Delete stale"):
+        removed = [id_val for id_val in stored_ids(collection) if id_val not in seen_ids]
+        delete_in_batches(collection, removed)
+    print(f"all_projects: {changes} new/changed, {len(removed)} removed, {len(seen_ids)} total")
+    return changes + len(removed)
+
+
+def csv_rows(csv_path):
+    """Yield (id, text) rows of the chunk CSV, batch by batch."""
+    for batch in pd.read_csv(csv_path, chunksize=BATCH_SIZE):
+        yield from zip(batch['id'].astype(str), batch['text'].astype(str))
+
+
+def drop_project_collections(chroma_client):
+    """Remove the legacy per-module copies; retrieval filters all_projects by module now."""
+    for col in chroma_client.list_collections():
+        if col.name.startswith("project_"):
+            chroma_client.delete_collection(col.name)
+            print(f"Dropped legacy collection '{col.name}'")
+
+
+def main():
+    global BATCH_SIZE, EMBED_THREADS
+    parser = argparse.ArgumentParser(description="Incrementally (re)build the Chroma collections.")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE,
+                        help="chunks read, embedded and written per step")
+    parser.add_argument("--threads", type=int, default=None,
+                        help="CPU inference threads (torch for hf, ONNX Runtime intra-op for onnx)")
+    parser.add_argument("--fresh", action="store_true",
+                        help="ignore an existing checkpoint")
+    parser.add_argument("--reembed", action="store_true",
+                        help="re-embed every chunk, even unchanged ones from the same runtime")
+    parser.add_argument("--numpy-dtype", choices=["float32", "float16", "none"], default="float32",
+                        help="dtype of the exported NumPy index, or 'none' to skip the export")
+    args = parser.parse_args()
+
+    BATCH_SIZE = args.batch_size
+    if args.threads and EMBED_BACKEND == "onnx":
+        EMBED_THREADS = args.threads          # onnx nodes may not have torch at all
+    elif args.threads:
+        import torch
+        torch.set_num_threads(args.threads)
+
+    start_build = datetime.now()
+    os.makedirs(DB_PATH, exist_ok=True)
+    chroma_client = chromadb.PersistentClient(path=DB_PATH)
+
+    print(f"Streaming data from {ALL_CHUNKS_FILE} in batches of {BATCH_SIZE}...")
+    resume_from = 0 if args.fresh or args.reembed else load_checkpoint(ALL_CHUNKS_FILE)
+    print(f"Embedding runtime: {embedding_id()}")
+    changes = sync_all_projects(chroma_client, ALL_CHUNKS_FILE, resume_from, args.reembed)
+    drop_project_collections(chroma_client)
+    clear_checkpoint()
+
+    index_missing = not os.path.exists(os.path.join(NUMPY_INDEX_DIR, "meta.json"))
+    if args.numpy_dtype != "none" and (changes or resume_from or index_missing):
+        with phase("NumPy export"):
+            export_numpy_index(chroma_client.get_collection("all_projects"), NUMPY_INDEX_DIR,
+                               dtype=args.numpy_dtype, page_size=BATCH_SIZE * 16)
+
+    if changes or resume_from or not os.path.exists(LEXICAL_INDEX_FILE):
+        with phase("Lexical index"):
+            build_lexical_index(csv_rows(ALL_CHUNKS_FILE), LEXICAL_INDEX_FILE)
+
+    if changes or resume_from:
+        # Tell running retrievers that their cached collection handles are stale
+        with open(os.path.join(DB_PATH, ".icat_build_stamp"), "w") as stamp:
+            stamp.write(datetime.now().isoformat())
+        print(f"\nIndex updated: {changes} chunk changes.")
+    else:
+        print("\nIndex already up to date.")
+
+    print_phase_times()
+    calc_and_print_time(start_build, "Total build")
+
+
+if __name__ == "__main__":
+    main()
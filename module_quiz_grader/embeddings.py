@@ -0,0 +1,116 @@
+"""
+embeddings.py
+─────────────────────────────────────────────────────────
+One place that decides which bge-m3 runtime embeds chunks and queries.
+
+  hf    – llama_index HuggingFaceEmbedding (PyTorch, full precision)
+  onnx  – int8-quantized ONNX Runtime export made by export_onnx.py;
+          no torch at run time, a fraction of the RAM, faster on CPU
+
+Both expose the two calls the indexer and the retriever use:
+get_query_embedding(text) and _get_text_embeddings(texts).
+
+Chunks and queries must be embedded by the same backend.  embed.py stores
+embedding_id() with every chunk and re-embeds the chunks whose id differs,
+so re-running it after a switch is enough (bench_embeddings.py shows how
+close the two are).
+
+Env:
+    ICAT_EMBED_BACKEND   hf | onnx                    (default hf)
+    ICAT_EMBED_MODEL     bge-m3 checkpoint directory
+    ICAT_EMBED_ONNX      quantized export directory   (default <model>-onnx-int8)
+    ICAT_EMBED_THREADS   ONNX Runtime intra-op threads (default: all cores)
+"""
+
+import os
+from datetime import datetime
+
+EMBED_BACKEND  = os.getenv("ICAT_EMBED_BACKEND", "hf")
+EMBED_MODEL    = os.getenv("ICAT_EMBED_MODEL", "D:/bge-m3/bge-m3")
+ONNX_MODEL_DIR = os.getenv("ICAT_EMBED_ONNX", EMBED_MODEL.rstrip("/\\") + "-onnx-int8")
+ONNX_THREADS   = int(os.getenv("ICAT_EMBED_THREADS", "0"))   # 0 = let ORT decide
+MAX_LENGTH     = 512      # tokens per text; chunk_pdf.py keeps chunks well below this
+
+
+class OnnxEmbedding:
+    """bge-m3 dense embeddings (CLS pooling, L2-normalised) from an ONNX export."""
+
+    query_instruction = None
+
+    def __init__(self, model_dir=ONNX_MODEL_DIR, embed_batch_size=32, threads=ONNX_THREADS):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+
+        model_file = next((f for f in ("model_quantized.onnx", "model.onnx")
+                           if os.path.exists(os.path.join(model_dir, f))), None)
+        if model_file is None:
+            raise FileNotFoundError(f"No ONNX model in {model_dir}; run export_onnx.py first")
+
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.session = ort.InferenceSession(os.path.join(model_dir, model_file), options,
+                                            providers=["CPUExecutionProvider"])
+        self._inputs = {i.name for i in self.session.get_inputs()}
+        self.embed_batch_size = embed_batch_size
+        self.model_name = os.path.join(model_dir, model_file)
+
+    def _embed(self, texts):
+        import numpy as np
+
+        vectors = []
+        for i in range(0, len(texts), self.embed_batch_size):
+            encoded = self.tokenizer(texts[i:i + self.embed_batch_size], padding=True,
+                                     truncation=True, max_length=MAX_LENGTH, return_tensors="np")
+            feed = {name: value for name, value in encoded.items() if name in self._inputs}
+            hidden = self.session.run(None, feed)[0]          # (batch, seq, dim)
+            cls = hidden[:, 0]
+            vectors.append(cls / np.linalg.norm(cls, axis=1, keepdims=True))
+        return np.concatenate(vectors).tolist() if vectors else []
+
+    def _get_text_embeddings(self, texts):
+        return self._embed(list(texts))
+
+    def get_query_embedding(self, query):
+        return self._embed([query])[0]
+
+    def get_text_embedding(self, text):
+        return self._embed([text])[0]
+
+
+def embedding_id(backend=None, model_path=None) -> str:
+    """Which runtime + model produces the vectors, e.g. 'onnx:bge-m3-onnx-int8'."""
+    backend = backend or EMBED_BACKEND
+    path = model_path or (ONNX_MODEL_DIR if backend == "onnx" else EMBED_MODEL)
+    return f"{backend}:{os.path.basename(path.rstrip('/' + os.sep))}"
+
+
+def load_embed_model(backend=None, model_path=None, embed_batch_size=32, threads=None):
+    """
+    Build the configured embedding model.
+
+    Args:
+        backend (str): "hf" or "onnx" (default ICAT_EMBED_BACKEND)
+        model_path (str): Checkpoint dir for hf, export dir for onnx
+                          (default ICAT_EMBED_MODEL / ICAT_EMBED_ONNX)
+        embed_batch_size (int): Texts per forward pass
+        threads (int): ONNX Runtime intra-op threads (default ICAT_EMBED_THREADS)
+
+    Returns:
+        An object with get_query_embedding() and _get_text_embeddings()
+    """
+    backend = backend or EMBED_BACKEND
+    start_time = datetime.now()
+    if backend == "onnx":
+        model = OnnxEmbedding(model_path or ONNX_MODEL_DIR, embed_batch_size=embed_batch_size,
+                              threads=threads or ONNX_THREADS)
+    elif backend == "hf":
+        from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+        model = HuggingFaceEmbedding(model_path or EMBED_MODEL, embed_batch_size=embed_batch_size)
+    else:
+        raise ValueError(f"Unknown embedding backend '{backend}' (expected hf or onnx)")
+    print(f"Loaded {backend} embedding model in {(datetime.now() - start_time).total_seconds():.2f} seconds.")
+    return model
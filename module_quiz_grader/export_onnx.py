@@ -0,0 +1,53 @@
+"""
+export_onnx.py
+─────────────────────────────────────────────────────────
+Export bge-m3 to ONNX and quantize it to int8 (dynamic quantization),
+for ICAT_EMBED_BACKEND=onnx on CPU-only grader nodes.
+
+Needs `optimum[onnxruntime]` on the machine doing the export only;
+the graders themselves just need onnxruntime + transformers.
+
+Run:   python export_onnx.py [--model D:/bge-m3/bge-m3] [--out DIR] [--arch avx512_vnni]
+       then re-run embed.py with ICAT_EMBED_BACKEND=onnx (it re-embeds every
+       chunk whose stored embedding id is not the ONNX one)
+"""
+
+import argparse
+import shutil
+from datetime import datetime
+from pathlib import Path
+from embeddings import EMBED_MODEL, ONNX_MODEL_DIR
+
+
+def export(model_path, out_dir, arch):
+    from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+    from transformers import AutoTokenizer
+
+    fp32_dir = Path(out_dir) / "fp32"
+    print(f"Exporting {model_path} to ONNX...")
+    model = ORTModelForFeatureExtraction.from_pretrained(model_path, export=True)
+    model.save_pretrained(fp32_dir)
+
+    print(f"Quantizing to int8 for {arch}...")
+    config = getattr(AutoQuantizationConfig, arch)(is_static=False, per_channel=False)
+    ORTQuantizer.from_pretrained(fp32_dir).quantize(save_dir=out_dir, quantization_config=config)
+    AutoTokenizer.from_pretrained(model_path).save_pretrained(out_dir)
+    shutil.rmtree(fp32_dir)       # fp32 export (with external weights) is ~2 GB
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export an int8 ONNX copy of the embedding model.")
+    parser.add_argument("--model", default=EMBED_MODEL, help="bge-m3 checkpoint directory")
+    parser.add_argument("--out", default=ONNX_MODEL_DIR, help="where to write model_quantized.onnx")
+    parser.add_argument("--arch", default="avx512_vnni", choices=["avx2", "avx512", "avx512_vnni", "arm64"],
+                        help="CPU instruction set the int8 kernels target")
+    args = parser.parse_args()
+
+    start_time = datetime.now()
+    export(args.model, args.out, args.arch)
+    print(f"Saved {args.out} in {(datetime.now() - start_time).total_seconds():.2f} seconds.")
+
+
+if __name__ == "__main__":
+    main()
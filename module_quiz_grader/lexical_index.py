@@ -0,0 +1,151 @@
+"""
+lexical_index.py
+─────────────────────────────────────────────────────────
+BM25 over the chunk texts, for exact terms dense retrieval tends to
+miss ("MFA", "VPN", "customs fee", "OneDrive").
+
+embed.py builds the index once per rebuild and saves it as compact JSON:
+
+    {"k1": 1.2, "b": 0.75,
+     "ids":     ["<chunk id>", …],
+     "modules": ["<module code>", …],
+     "lengths": [<tokens per chunk>, …],
+     "postings": {"<term>": [doc, tf, doc, tf, …]}}
+
+At query time only the postings of the query terms are touched.
+"""
+
+import json
+import math
+import os
+import re
+from collections import Counter, defaultdict
+
+K1 = 1.2
+B = 0.75
+
+_TOKEN = re.compile(r"[a-z0-9]+(?:['’\-][a-z0-9]+)*")
+STOPWORDS = frozenset("""
+a about above after again all am an and any are as at be because been before being
+below between both but by can could did do does doing down during each few for from
+further had has have having he her here hers him his how i if in into is it its itself
+just me more most my no nor not of off on once only or other our ours out over own same
+she should so some such than that the their theirs them then there these they this
+those through to too under until up very was we were what when where which while who
+whom why will with would you your yours
+""".split())
+
+
+def tokenize(text):
+    """Lower-cased word tokens without stopwords; keeps short acronyms like 'mfa'."""
+    return [t for t in _TOKEN.findall(text.lower()) if t not in STOPWORDS]
+
+
+def build_index(rows, path, k1=K1, b=B):
+    """
+    Build the inverted index from (chunk id, text) rows, streamed, and
+    write it atomically to `path`.
+
+    Returns:
+        int: number of chunks indexed
+    """
+    ids, modules, lengths = [], [], []
+    postings = defaultdict(list)
+    for id_val, text in rows:
+        doc = len(ids)
+        terms = Counter(tokenize(text))
+        for term, tf in terms.items():
+            postings[term].extend((doc, tf))
+        ids.append(id_val)
+        modules.append(id_val.split("_")[0])
+        lengths.append(sum(terms.values()))
+
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"k1": k1, "b": b, "ids": ids, "modules": modules,
+                   "lengths": lengths, "postings": postings},
+                  f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp, path)
+    print(f"Lexical index: {len(ids)} chunks, {len(postings)} terms → {path}")
+    return len(ids)
+
+
+class LexicalIndex:
+    def __init__(self, path):
+        """
+        Args:
+            path (str): JSON index written by build_index()
+        """
+        self.path = path
+        self._mtime = None
+        self._load()
+
+    def _load(self):
+        """(Re)load the index when embed.py has rewritten it."""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            return
+        if mtime == self._mtime:
+            return
+        with open(self.path, encoding="utf-8") as f:
+            data = json.load(f)
+        self.ids = data["ids"]
+        self.modules = data["modules"]
+        self.k1, self.b = data["k1"], data["b"]
+        n = len(self.ids)
+        avg_len = sum(data["lengths"]) / n if n else 1.0
+        # per-document length normalisation, precomputed
+        self._norm = [self.k1 * (1 - self.b + self.b * length / avg_len) for length in data["lengths"]]
+        self.postings = data["postings"]
+        self._idf = {term: math.log(1 + (n - len(p) / 2 + 0.5) / (len(p) / 2 + 0.5))
+                     for term, p in self.postings.items()}
+        self._mtime = mtime
+        print(f"Loaded lexical index: {n} chunks, {len(self.postings)} terms.")
+
+    @property
+    def ready(self):
+        self._load()
+        return self._mtime is not None
+
+    def search(self, query, top_k=10, module=None):
+        """
+        BM25-score the chunks that contain any query term.
+
+        Args:
+            query (str): The query string.
+            top_k (int): Number of hits to return.
+            module (str): Only score chunks of this module code (None = all).
+
+        Returns:
+            list: (chunk id, score) pairs, best first
+        """
+        if not self.ready:
+            return []
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            p = self.postings.get(term)
+            if not p:
+                continue
+            idf = self._idf[term]
+            for i in range(0, len(p), 2):
+                doc, tf = p[i], p[i + 1]
+                if module and self.modules[doc] != module:
+                    continue
+                scores[doc] += idf * tf * (self.k1 + 1) / (tf + self._norm[doc])
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+        return [(self.ids[doc], score) for doc, score in best]
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """
+    Fuse several ranked id lists: score = Σ 1 / (k + rank).
+
+    Returns:
+        list: (id, fused score) pairs, best first
+    """
+    fused = defaultdict(float)
+    for ranking in rankings:
+        for rank, id_val in enumerate(ranking, start=1):
+            fused[id_val] += 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
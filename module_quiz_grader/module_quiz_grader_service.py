@@ -5,24 +5,81 @@ Grades a 5-question module quiz (essay-only) using a local
 Qwen-2-7B Ollama model.  Returns per-question scores +
 overall feedback in JSON.
 
+Grading modes (ICAT_MODULE_GRADING_MODE):
+  per_question – every question is its own small chat call, run
+                 concurrently (ICAT_MODULE_CONCURRENCY); totals are
+                 assembled in Python.                       (default)
+  quiz         – the whole quiz in one chat call (original behaviour).
+
+POST /grade_batch takes {"submissions": [QuizIn, …]} and streams one
+NDJSON line per quiz as it finishes.  Identical question/answer pairs
+across the batch are graded once, and context is retrieved once per
+module.  Batches are always graded per question.
+
+Job mode: POST /jobs/grade_quiz queues the quiz and returns a job id at
+once (202); GET /jobs/{job_id}?wait=30 long-polls for the result.  Jobs
+live in SQLite (grader_common/jobs.py) and survive a restart.
+
+Fast start: the port binds immediately; bge-m3 and the vector index are
+loaded by a background startup task.  GET /healthz answers right away,
+GET /readyz turns 200 once retrieval is warm (or at once with
+ICAT_GRADE_WITHOUT_CONTEXT=1, which grades questions missing from the
+prebuilt context index without context until then).
+
 Run:   uvicorn module_quiz_grader:app --host 0.0.0.0 --port 8010
 """
 
-import json, os, re
+import asyncio, json, os, re, sys, time
+from collections import defaultdict
+from pathlib import Path
 from typing import List
 from fastapi import FastAPI, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel, Field
-from ollama import Client
-from retriever import DocumentRetriever
+from context_budget import PER_REQUEST_TOKENS, assemble_context
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))   # repo root → grader_common
+from grader_common import llm
+from grader_common.admission import AdmissionGate
+from grader_common.cache import GradingCache, make_key, prompt_version
+from grader_common import batch
+from grader_common.jobs import JobQueue, job_response
 
 # ─── config ────────────────────────────────────────────
 OLLAMA_MODEL = os.getenv("ICAT_MODULE_MODEL", "qwen2.5:7b")
-OLLAMA_HOST  = os.getenv("OLLAMA_HOST", "http://127.0.0.1:11434")
-_client = Client(host=OLLAMA_HOST)
+# Ollama host / connection pool: see grader_common/llm.py (OLLAMA_HOST, ICAT_OLLAMA_*)
+# In-flight and queue limits: see grader_common/admission.py (ICAT_MAX_*)
+_gate = AdmissionGate()
+# Per-question result cache: see grader_common/cache.py (ICAT_GRADE_CACHE*)
+_cache = GradingCache()
+
+GRADING_MODE  = os.getenv("ICAT_MODULE_GRADING_MODE", "per_question")  # or "quiz"
+CONCURRENCY   = int(os.getenv("ICAT_MODULE_CONCURRENCY", "4"))   # parallel chat calls
+RETRIES       = int(os.getenv("ICAT_MODULE_RETRIES", "1"))       # per question, on bad JSON
+FEEDBACK_MODE = os.getenv("ICAT_MODULE_FEEDBACK", "llm")         # or "template"
+_llm_slots = asyncio.Semaphore(CONCURRENCY)
 
 DB_PATH = r"../chroma_db" #adjust based on where the db is located in the project directory
-_rtr = DocumentRetriever(db_path=DB_PATH)
+RERANK_MODEL  = os.getenv("ICAT_RERANK_MODEL")   # cross-encoder path; unset = no rerank
+# fuse BM25 (lexical_index.json, built by embed.py) with vector hits
+HYBRID        = os.getenv("ICAT_HYBRID_RETRIEVAL", "1") == "1"
+# a reranked top-2 is at least as precise as a plain top-3, with a shorter prompt
+CONTEXT_TOP_K = int(os.getenv("ICAT_CONTEXT_TOP_K", "2" if RERANK_MODEL else "3"))
+# "chroma", or "numpy" for the memory-mapped index embed.py exports
+VECTOR_BACKEND = os.getenv("ICAT_VECTOR_BACKEND", "chroma")
+
+# Retriever is built by the startup task (see _warm_retriever); until then
+# requests wait up to WARM_WAIT seconds, or skip live retrieval if allowed
+GRADE_WITHOUT_CONTEXT = os.getenv("ICAT_GRADE_WITHOUT_CONTEXT", "0") == "1"
+WARM_WAIT = float(os.getenv("ICAT_WARM_WAIT", "60"))
+_rtr = None
+_retrieval = {"status": "cold", "seconds": None, "error": None}
+_retrieval_ready = asyncio.Event()
+
+# Prebuilt question → context chunks map, written by build_context_index.py
+CONTEXT_INDEX_PATH = os.getenv("ICAT_CONTEXT_INDEX", os.path.join(DB_PATH, "context_index.json"))
+_ctx_index = {"mtime": None, "top_k": 0, "questions": {}, "chunks": {}}
 
 SYSTEM_PROMPT = """
 <introduction>
@@ -85,6 +142,44 @@ Only return the JSON object, no extra text or formatting.
 </notes>
 """
 
+QUESTION_SYSTEM_PROMPT = """
+<introduction>
+You are *iCAT Module-Quiz Grader v1*, a friendly security‐awareness instructor.
+You receive a JSON object describing ONE quiz question:
+  • `id`            – unique question_id
+  • `stem`          – the question text, optionally followed by a `### Context` block from the module
+  • `user_answer`   – the learner’s answer
+  • `rubric`        - list of {point,value,weight}
+</introduction>
+
+<instructions>
+    • Compare `user_answer` against each rubric item.
+    • Compute `score = Σ(value_i × weight_i) / Σ(value_i)` (a decimal between 0 and 1).
+    • You analyze the user's answer and compare it to the rubric and the context given, if no similarities between them at all, give `score`: 0.
+    • The context further helps in grading the user's answer, so use it wisely.
+    • Provide a brief but friendly sentence: mention what the learner did well (rubric points they hit), what’s missing, and one concrete suggestion.
+    • If `user_answer` is empty or null, give `score`: 0 and a friendly explanation like “You did not provide an answer.”
+    • If `user_answer` is very generic like "I would follow best practice." or something similar in meaning, give `score`: 0 and a friendly explanation like “Your answer is too generic, specific details are required”
+    • When giving feedback, you don't reference the rubric points as "Point A" or similar, you reference them as normal sentences.
+</instructions>
+
+<output_format>
+Return **only** a raw JSON object (no markdown fences, no extra text) in this exact format:
+
+{"id": "…", "score": 0–1 (float), "explanation": "Friendly, specific feedback about that answer."}
+</output_format>
+"""
+
+FEEDBACK_SYSTEM_PROMPT = """
+You are *iCAT Module-Quiz Grader v1*, a friendly security‐awareness instructor.
+You receive the per-question results of a learner's quiz as JSON
+(`score` 0–1 and the `explanation` already given to the learner).
+Write ONE brief summary paragraph (2–3 sentences): strengths, then one or two
+areas to improve. Friendly, modern and encouraging. Return only the paragraph text.
+"""
+
+PROMPT_VERSION = prompt_version(QUESTION_SYSTEM_PROMPT if GRADING_MODE == "per_question" else SYSTEM_PROMPT)
+
 # ─── pydantic models ──────────────────────────────────
 class RubricItem(BaseModel):
     point: str
@@ -102,28 +197,108 @@ class QuizIn(BaseModel):
     module_code: str
     questions: List[QuizQuestion]
 
+class QuizBatchIn(BaseModel):
+    submissions: List[QuizIn] = Field(..., min_length=1)
+
 # ─── helpers ───────────────────────────────────────────
 def _strip_md_fence(text: str) -> str:
     pat = r"^```(?:json)?\s*(.*?)\s*```$"
     m = re.match(pat, text.strip(), re.DOTALL | re.IGNORECASE)
     return m.group(1) if m else text
 
-def _augment_with_context(quiz: QuizIn, k: int = 3):
+def _load_context_index() -> dict:
+    """(Re)load the prebuilt context index whenever the file changes on disk."""
+    try:
+        mtime = os.stat(CONTEXT_INDEX_PATH).st_mtime_ns
+    except OSError:
+        return _ctx_index
+    if mtime != _ctx_index["mtime"]:
+        with open(CONTEXT_INDEX_PATH, encoding="utf-8") as f:
+            data = json.load(f)
+        _ctx_index.update(mtime=mtime, top_k=data["top_k"],
+                          questions=data["questions"], chunks=data["chunks"])
+        print(f"Loaded context index for {len(data['questions'])} questions.")
+    return _ctx_index
+
+def _attach_context(q: QuizQuestion, passages: List[str]):
+    if passages:
+        context_block = "\n\n".join(passages)
+        q.stem = f"{q.stem}\n\n### Context\n{context_block}"
+
+def _indexed_context(questions: List[QuizQuestion], k: int = CONTEXT_TOP_K):
+    """Hits from the prebuilt index per question (None = needs live retrieval)."""
+    index = _load_context_index()
+    hits = []
+    for q in questions:
+        ids = index["questions"].get(q.id)
+        if ids is not None and index["top_k"] >= k:
+            hits.append([{"id": i, "text": index["chunks"][i]} for i in ids[:k]])
+        else:
+            hits.append(None)
+    return hits
+
+def _retrieve_hits(module_code: str, questions: List[QuizQuestion], rtr=None,
+                   k: int = CONTEXT_TOP_K):
     """
-    For every essay question, fetch top-k passages from the module’s
-    Chroma collection and append them under '### Context'.
+    Top-k chunks per question from the module's chunks in 'all_projects'.
+    Known question ids are served from the prebuilt context index; only
+    unknown ones go through live retrieval (skipped when rtr is None).
+
+    Returns the hits per question and the ids left without any because
+    retrieval was not warm.
     """
-    coll_name = f"project_{quiz.module_code}"
-    if not _rtr.set_collection(coll_name):        # fall back to all_projects
-        _rtr.set_collection("all_projects")
+    hits = _indexed_context(questions, k)
+    live = [n for n, h in enumerate(hits) if h is None]
+    hits = [h or [] for h in hits]
 
-    for q in quiz.questions:
-        ctx_hits = _rtr.retrieve_documents(q.stem, top_k=k)
-        if isinstance(ctx_hits, str) or not ctx_hits:
-            continue
-        context_block = "\n\n".join(p["text"] for p in ctx_hits)
-        q.stem = f"{q.stem}\n\n### Context\n{context_block}"
-    return quiz
+    if live and rtr is None:
+        print(f"Retrieval not warm yet: grading {len(live)} questions without context.")
+        return hits, {questions[n].id for n in live}
+    if live:
+        # all_projects filtered to the module's chunks; unknown modules search everything
+        module = module_code if rtr.has_module(module_code) else None
+
+        # one batched embedding + one multi-vector query for the remaining questions
+        all_hits = rtr.retrieve_many([questions[n].stem for n in live], top_k=k,
+                                      module=module, rerank=bool(RERANK_MODEL),
+                                      hybrid=HYBRID)
+        if not isinstance(all_hits, str):
+            for n, ctx_hits in zip(live, all_hits):
+                hits[n] = ctx_hits
+    return hits, set()
+
+def _apply_context(questions: List[QuizQuestion], hits, shared_prompt: bool):
+    """
+    Merge and trim one quiz's hits to the context token budgets
+    (context_budget.py) and append them under '### Context'.  Only a
+    shared prompt ("quiz" mode) is held to the per-request budget and
+    skips passages an earlier question already carries.
+
+    Returns the ids of questions that had hits but got no passage.
+    """
+    passages_per_question = assemble_context(
+        hits, per_request=PER_REQUEST_TOKENS if shared_prompt else None, dedupe=shared_prompt)
+    starved, given = set(), set()
+    for q, q_hits, passages in zip(questions, hits, passages_per_question):
+        _attach_context(q, passages)
+        ids = {h["id"] for h in q_hits}
+        # with dedupe, hits already given to an earlier question are in the prompt
+        if passages:
+            given |= ids
+        elif ids and not (shared_prompt and ids <= given):
+            starved.add(q.id)
+    return starved
+
+def _augment_with_context(quiz: QuizIn, rtr=None, k: int = CONTEXT_TOP_K):
+    """
+    For every essay question, fetch top-k passages (_retrieve_hits) and
+    attach them within the quiz's context budget.
+
+    Returns the quiz and the ids of questions graded without context.
+    """
+    hits, missing = _retrieve_hits(quiz.module_code, quiz.questions, rtr, k)
+    starved = _apply_context(quiz.questions, hits, shared_prompt=GRADING_MODE == "quiz")
+    return quiz, missing | starved
 
 def _build_messages(payload: QuizIn):
     user_block = (
@@ -135,26 +310,333 @@ def _build_messages(payload: QuizIn):
         {"role": "user",   "content": user_block}
     ]
 
-def _ask_llm(payload: QuizIn) -> str:
-    rsp = _client.chat(
-        model=OLLAMA_MODEL,
-        messages=_build_messages(payload),
-        stream=False
+async def _ask_llm(payload: QuizIn) -> str:
+    return await llm.chat(OLLAMA_MODEL, _build_messages(payload))
+
+def _cache_key(q: QuizQuestion) -> str:
+    return make_key(OLLAMA_MODEL, PROMPT_VERSION, q.id,
+                    [r.model_dump() for r in q.rubric], q.user_answer)
+
+# ─── per-question mode ─────────────────────────────────
+def _clamp_score(value) -> float:
+    try:
+        return round(min(max(float(value), 0.0), 1.0), 2)
+    except (TypeError, ValueError):
+        return 0.0
+
+def _build_question_messages(q: QuizQuestion):
+    user_block = (
+        "GRADE the following quiz question JSON. Respond only with the "
+        "JSON object specified.\n" + q.model_dump_json()
+    )
+    return [
+        {"role": "system", "content": QUESTION_SYSTEM_PROMPT.strip()},
+        {"role": "user",   "content": user_block}
+    ]
+
+async def _grade_question(q: QuizQuestion) -> dict:
+    """
+    Grade one question in its own chat call.  A malformed reply only
+    costs a retry of this question, not of the whole quiz.
+    """
+    messages = _build_question_messages(q)
+    clean = ""
+    for _ in range(RETRIES + 1):
+        async with _llm_slots:
+            raw = await llm.chat(OLLAMA_MODEL, messages)
+        clean = _strip_md_fence(raw)
+        try:
+            graded = json.loads(clean)
+        except json.JSONDecodeError:
+            continue
+        if isinstance(graded, dict) and "score" in graded:
+            return {"id": q.id, "score": _clamp_score(graded["score"]),
+                    "explanation": str(graded.get("explanation", ""))}
+    raise HTTPException(
+        status_code=500,
+        detail=f"Model did not return valid JSON for {q.id}. Got: {clean[:200]}…"
     )
-    return rsp["message"]["content"]
+
+# questions being graded right now, by cache key: identical answers that
+# arrive meanwhile (same batch or concurrent requests) share one LLM call
+_inflight = {}                          # cache key -> [task, number of waiters]
+
+async def _grade_question_once(key: str, q: QuizQuestion) -> dict:
+    entry = _inflight.get(key)
+    if entry is None:
+        task = asyncio.ensure_future(_grade_question(q))
+        entry = _inflight[key] = [task, 0]
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    task = entry[0]
+    entry[1] += 1
+    try:
+        return dict(await asyncio.shield(task))
+    finally:
+        # the last waiter to give up (cancelled request) stops the LLM call
+        entry[1] -= 1
+        if entry[1] == 0 and not task.done():
+            task.cancel()
+
+def _template_feedback(scores: List[dict]) -> str:
+    strong = sum(s["score"] >= 0.7 for s in scores)
+    weak   = [s for s in scores if s["score"] < 0.5]
+    text = f"You gave strong answers to {strong} of {len(scores)} questions."
+    if weak:
+        text += (f" Revisit the {len(weak)} question(s) with lower scores and add the "
+                 "specific steps mentioned in their feedback.")
+    else:
+        text += " Great job applying the module, keep it up!"
+    return text
+
+async def _overall_feedback(scores: List[dict]) -> str:
+    """One cheap summary call over the per-question explanations."""
+    if FEEDBACK_MODE == "template":
+        return _template_feedback(scores)
+    try:
+        async with _llm_slots:
+            raw = await llm.chat(OLLAMA_MODEL, [
+                {"role": "system", "content": FEEDBACK_SYSTEM_PROMPT.strip()},
+                {"role": "user",   "content": json.dumps(scores)}
+            ])
+        return raw.strip() or _template_feedback(scores)
+    except Exception as e:
+        print(f"Overall feedback call failed, using template: {e}")
+        return _template_feedback(scores)
+
+def _assemble(scores: List[dict], feedback: str) -> dict:
+    """Build the response totals in Python instead of trusting the model's arithmetic."""
+    total     = round(sum(s["score"] for s in scores), 2)
+    max_score = float(len(scores))
+    return {
+        "scores": scores,
+        "overall": {
+            "score": total,
+            "max_score": max_score,
+            "percentage": round(100 * total / max_score, 2) if max_score else 0.0,
+            "feedback": feedback,
+        },
+    }
 
 # ─── fastapi app ───────────────────────────────────────
 app = FastAPI(title="iCAT Module-Quiz Grader", version="1.0.0")
 
-@app.post("/grade_quiz")
-def grade_quiz(quiz: QuizIn):
-    raw = _ask_llm(_augment_with_context(quiz))
-    clean = _strip_md_fence(raw)
+def _load_retriever():
+    # heavy imports (llama_index / torch or onnxruntime, chromadb) happen here
+    from retriever import DocumentRetriever
+    rtr = DocumentRetriever(db_path=DB_PATH, rerank_model_path=RERANK_MODEL, backend=VECTOR_BACKEND)
+    rtr.warm_up()
+    return rtr
 
+async def _warm_retriever():
+    global _rtr
+    _retrieval["status"] = "warming"
+    start = time.monotonic()
     try:
-        return json.loads(clean)
-    except json.JSONDecodeError:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Model did not return valid JSON. Got: {clean[:200]}…"
+        _rtr = await run_in_threadpool(_load_retriever)
+    except Exception as e:
+        _retrieval.update(status="failed", error=str(e))
+        print(f"Retriever failed to load: {e}")
+        return
+    _retrieval.update(status="ready", seconds=round(time.monotonic() - start, 2))
+    _retrieval_ready.set()
+
+async def _get_retriever():
+    """The warm retriever; None if grading without context is allowed meanwhile."""
+    if _retrieval_ready.is_set():
+        return _rtr
+    if GRADE_WITHOUT_CONTEXT:
+        return None
+    if _retrieval["status"] != "failed":
+        try:
+            await asyncio.wait_for(_retrieval_ready.wait(), WARM_WAIT)
+            return _rtr
+        except asyncio.TimeoutError:
+            pass
+    raise HTTPException(status_code=503, detail=f"Retrieval is {_retrieval['status']}",
+                        headers={"Retry-After": str(_gate.retry_after)})
+
+@app.on_event("startup")
+async def _start_warm_up():
+    # bind the port now; bge-m3 and the collections load in the background
+    app.state.warm_task = asyncio.create_task(_warm_retriever())
+    _jobs.start()
+
+@app.on_event("shutdown")
+async def _close_llm_pool():
+    await _jobs.stop()
+    await llm.close_client()
+
+@app.post("/grade_quiz")
+async def grade_quiz(quiz: QuizIn):
+    # Questions answered identically before are served from the cache and
+    # skip both retrieval and the LLM.
+    results, pending = {}, []
+    for q in quiz.questions:
+        hit = _cache.get(_cache_key(q))
+        if hit is not None:
+            results[q.id] = {"id": q.id, "score": hit["score"], "explanation": hit["explanation"]}
+        else:
+            pending.append(q)
+
+    if not pending:
+        scores = [results[q.id] for q in quiz.questions]
+        return _assemble(scores, _template_feedback(scores))
+
+    feedback = None
+    async with _gate.admit():
+        keys = {q.id: _cache_key(q) for q in pending}
+        needs_live = any(h is None for h in _indexed_context(pending))
+        rtr = await _get_retriever() if needs_live else None
+        todo, without_context = await run_in_threadpool(
+            _augment_with_context, quiz.model_copy(update={"questions": pending}), rtr
         )
+
+        if GRADING_MODE == "per_question":
+            for s in await asyncio.gather(*(_grade_question_once(keys[q.id], q)
+                                            for q in todo.questions)):
+                results[s["id"]] = s
+        else:
+            clean = _strip_md_fence(await _ask_llm(todo))
+            try:
+                graded = json.loads(clean)
+            except json.JSONDecodeError:
+                graded = None
+            if not isinstance(graded, dict):
+                raise HTTPException(
+                    status_code=500,
+                    detail=f"Model did not return a valid JSON object. Got: {clean[:200]}…"
+                )
+            scores = graded.get("scores")
+            by_id = {s.get("id"): s for s in (scores if isinstance(scores, list) else [])
+                     if isinstance(s, dict)}
+            for q in todo.questions:
+                if q.id not in by_id:
+                    raise HTTPException(
+                        status_code=500,
+                        detail=f"Model did not grade question {q.id}. Got: {clean[:200]}…"
+                    )
+                results[q.id] = {"id": q.id, "score": _clamp_score(by_id[q.id].get("score")),
+                                 "explanation": str(by_id[q.id].get("explanation", ""))}
+            overall = graded.get("overall")
+            feedback = overall.get("feedback") if isinstance(overall, dict) else None
+
+        # answers graded without their context are not cached
+        for q in todo.questions:
+            if q.id in without_context:
+                continue
+            _cache.put(keys[q.id], {"score": results[q.id]["score"],
+                                    "explanation": results[q.id]["explanation"]})
+
+        scores = [results[q.id] for q in quiz.questions]
+        if not feedback:
+            feedback = await _overall_feedback(scores)
+    return _assemble(scores, feedback)
+
+async def _prepare_batch(quizzes: List[QuizIn]):
+    """
+    Look every question up in the cache, retrieve context once per module
+    for the distinct uncached ones, and start one grading task per
+    distinct question/answer pair.  Context budgets still apply per quiz:
+    each pair gets its context within the first quiz that contains it.
+    Returns [(quiz id, coroutine), …].
+    """
+    keys = [[_cache_key(q) for q in quiz.questions] for quiz in quizzes]
+    done, pending = {}, {}                 # cache key -> result / (owning quiz no., question)
+    for n, (quiz, quiz_keys) in enumerate(zip(quizzes, keys)):
+        for q, key in zip(quiz.questions, quiz_keys):
+            if key in done or key in pending:
+                continue
+            hit = _cache.get(key)
+            if hit is not None:
+                done[key] = hit
+            else:
+                # a copy: _attach_context rewrites the stem in place
+                pending[key] = (n, q.model_copy())
+
+    by_module = defaultdict(list)
+    for key, (n, _) in pending.items():
+        by_module[quizzes[n].module_code].append(key)
+
+    hits, without_context = {}, set()
+    for module_code, module_keys in by_module.items():
+        questions = [pending[key][1] for key in module_keys]
+        needs_live = any(h is None for h in _indexed_context(questions))
+        rtr = await _get_retriever() if needs_live else None
+        module_hits, missing = await run_in_threadpool(_retrieve_hits, module_code, questions, rtr)
+        for key, q, q_hits in zip(module_keys, questions, module_hits):
+            hits[key] = q_hits
+            if q.id in missing:
+                without_context.add(key)
+
+    by_quiz = defaultdict(list)
+    for key, (n, _) in pending.items():
+        by_quiz[n].append(key)
+    for quiz_keys in by_quiz.values():
+        questions = [pending[key][1] for key in quiz_keys]
+        # batches are graded per question: no cross-question dedupe or request budget
+        starved = _apply_context(questions, [hits[key] for key in quiz_keys], shared_prompt=False)
+        without_context.update(key for key, q in zip(quiz_keys, questions) if q.id in starved)
+    augmented = {key: q for key, (_, q) in pending.items()}
+    print(f"Batch of {len(quizzes)} quizzes: {len(done)} cached, {len(pending)} distinct "
+          f"to grade across {len(by_module)} modules.")
+
+    cached = set()
+
+    async def grade_key(key):
+        # quizzes sharing a key share one call through _grade_question_once
+        s = await _grade_question_once(key, augmented[key])
+        if key not in without_context and key not in cached:
+            cached.add(key)
+            _cache.put(key, {"score": s["score"], "explanation": s["explanation"]})
+        return s
+
+    # grading runs inside each quiz's coroutine, so cancelling the stream
+    # (client gone) cancels the LLM calls no other quiz is waiting on
+    async def finish(quiz, quiz_keys):
+        tasks = [asyncio.ensure_future(grade_key(key)) for key in quiz_keys if key not in done]
+        try:
+            graded = iter(await asyncio.gather(*tasks))
+        finally:
+            for task in tasks:
+                task.cancel()           # no-op once finished
+        scores = []
+        for q, key in zip(quiz.questions, quiz_keys):
+            s = done[key] if key in done else next(graded)
+            scores.append({"id": q.id, "score": s["score"], "explanation": s["explanation"]})
+        return _assemble(scores, await _overall_feedback(scores))
+
+    return [(quiz.quiz_id, finish(quiz, quiz_keys)) for quiz, quiz_keys in zip(quizzes, keys)]
+
+@app.post("/grade_batch")
+async def grade_batch(payload: QuizBatchIn):
+    batch.check_size(len(payload.submissions))
+    return await batch.stream_batch(_gate, lambda: _prepare_batch(payload.submissions))
+
+async def _run_quiz_job(payload: dict) -> dict:
+    return await grade_quiz(QuizIn(**payload))
+
+# Asynchronous jobs: see grader_common/jobs.py (ICAT_JOB*)
+_jobs = JobQueue({"grade_quiz": _run_quiz_job})
+
+@app.post("/jobs/grade_quiz", status_code=202)
+def submit_quiz_job(quiz: QuizIn):
+    job = _jobs.submit("grade_quiz", quiz.model_dump())
+    return {"job_id": job["id"], "status": job["status"]}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, wait: float = 0):
+    return job_response(await _jobs.wait(job_id, wait))
+
+@app.get("/stats")
+def stats():
+    return {"admission": _gate.stats(), "cache": _cache.stats(), "jobs": _jobs.stats()}
+
+@app.get("/healthz")
+def healthz():
+    return {"status": "ok"}
+
+@app.get("/readyz")
+def readyz():
+    ready = _retrieval_ready.is_set() or GRADE_WITHOUT_CONTEXT
+    return JSONResponse(status_code=200 if ready else 503,
+                        content={"ready": ready, "retrieval": _retrieval})
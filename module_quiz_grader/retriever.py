@@ -1,27 +1,74 @@
-import chromadb
-from llama_index.vector_stores.chroma import ChromaVectorStore
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from sentence_transformers import CrossEncoder
+from vector_backends import ChromaBackend, NumpyBackend
+from lexical_index import LexicalIndex, reciprocal_rank_fusion
+from embeddings import load_embed_model
+
+# Cross-encoders are loaded once per process and shared by all retrievers
+_cross_encoders = {}
+RERANK_CACHE_SIZE = 50000      # cached (query, chunk) scores
 
 
 class DocumentRetriever:
     def __init__(self, collection_name="all_projects", db_path="../chroma_db",
-                 embedding_model_path="D:/bge-m3/bge-m3"):
+                 embedding_model_path=None, rerank_model_path=None,
+                 backend="chroma", index_dir=None, lexical_index_path=None, embed_backend=None):
         """
         Initialize the DocumentRetriever with the specified collection name and embedding model.
 
         Args:
             collection_name (str): Name of the ChromaDB collection to use
             db_path (str): Path to the ChromaDB database
-            embedding_model_path (str): Path to the embedding model
+            embedding_model_path (str): Path to the embedding model (default: see embeddings.py)
+            rerank_model_path (str): Optional cross-encoder used by rerank=True
+            backend (str): "chroma", or "numpy" for the in-process index exported by embed.py
+            index_dir (str): NumPy index directory (default <db_path>/numpy_index)
+            lexical_index_path (str): BM25 index used by hybrid=True
+                                      (default <db_path>/lexical_index.json)
+            embed_backend (str): "hf" or "onnx" (default ICAT_EMBED_BACKEND)
         """
-        # Initialize Chroma client
-        self.chroma_client = chromadb.PersistentClient(path=db_path)
+        if backend == "numpy":
+            self.backend = NumpyBackend(index_dir or os.path.join(db_path, "numpy_index"))
+        else:
+            self.backend = ChromaBackend(db_path)
         self.collection_name = collection_name
 
+        # BM25 half of hybrid retrieval, searched while the queries are embedded
+        self.lexical = LexicalIndex(lexical_index_path or os.path.join(db_path, "lexical_index.json"))
+        self._lexical_pool = ThreadPoolExecutor(max_workers=1)
+
         # Initialize the embedding model
-        self.embed_model = HuggingFaceEmbedding(embedding_model_path)
+        self.embed_model = load_embed_model(embed_backend, embedding_model_path)
+
+        # Optional reranker, loaded on first use; scores cached by (query hash, chunk id)
+        self.rerank_model_path = rerank_model_path
+        self._rerank_scores = OrderedDict()
+        self._rerank_lock = threading.Lock()
+
+    def invalidate(self):
+        """Forget every cached collection handle."""
+        self.backend.invalidate()
+
+    def warm_up(self, collection_names=None):
+        """
+        Load the embedding model with a dummy query and open the collections
+        up front, so the first real request doesn't pay for it.
+
+        Args:
+            collection_names (list): Collections to open; defaults to all of them
+        """
+        start_time = datetime.now()
+        self.embed_model.get_query_embedding("warm-up")
+        if self.rerank_model_path:
+            self._get_cross_encoder().predict([("warm-up", "warm-up")])
+        names = collection_names or self.get_all_collections()
+        opened = [name for name in names if self.backend.has_collection(name)]
+        print(f"Retriever warm in {(datetime.now() - start_time).total_seconds():.2f} seconds "
+              f"({len(opened)} collections open).")
 
     def set_collection(self, collection_name):
         """
@@ -43,14 +90,7 @@ class DocumentRetriever:
         Returns:
             bool: True if the collection exists, False otherwise
         """
-        try:
-            # list_collections() returns Collection objects, extract names
-            collections = self.chroma_client.list_collections()
-            collection_names = [col.name for col in collections]
-            return self.collection_name in collection_names
-        except Exception as e:
-            print(f"Error checking collection existence: {e}")
-            return False
+        return self.backend.has_collection(self.collection_name)
 
     def get_all_collections(self):
         """
@@ -60,68 +100,182 @@ class DocumentRetriever:
             list: A list of collection names in the database
         """
         try:
-            # Extract names from Collection objects
-            collections = self.chroma_client.list_collections()
-            return [col.name for col in collections]
+            return self.backend.collection_names()
         except Exception as e:
             print(f"Error retrieving collections: {e}")
             return []
 
 
-    def retrieve_documents(self, query, top_k=5):
+    def _embed_queries(self, queries):
+        """
+        Embed all queries in one forward pass.  bge-m3 has no query
+        instruction, so the batched text path gives the same vectors.
+        """
+        if getattr(self.embed_model, "query_instruction", None):
+            return [self.embed_model.get_query_embedding(q) for q in queries]
+        return self.embed_model._get_text_embeddings(list(queries))
+
+    def has_module(self, module):
+        """
+        Check whether the current collection holds chunks tagged with `module`
+        (cached until the next rebuild).
+
+        Args:
+            module (str): Module code, e.g. "PH01"
+
+        Returns:
+            bool: True if at least one chunk belongs to the module
+        """
+        return self.backend.has_module(self.collection_name, module)
+
+    def _get_cross_encoder(self):
+        if self.rerank_model_path not in _cross_encoders:
+            from sentence_transformers import CrossEncoder
+            print(f"Loading cross-encoder {self.rerank_model_path}...")
+            _cross_encoders[self.rerank_model_path] = CrossEncoder(self.rerank_model_path)
+        return _cross_encoders[self.rerank_model_path]
+
+    def _rerank(self, queries, candidates, top_k):
         """
-        Retrieve the top_k most relevant documents from ChromaDB based on the query.
+        Score every (query, candidate) pair with the cross-encoder in one
+        batched call (skipping cached pairs) and keep the best top_k per query.
+        """
+        keys = [hashlib.sha1(q.encode("utf-8")).hexdigest() for q in queries]
+        todo = []
+        with self._rerank_lock:
+            for q, key, hits in zip(queries, keys, candidates):
+                for hit in hits:
+                    score = self._rerank_scores.get((key, hit["id"]))
+                    if score is None:
+                        todo.append((q, key, hit))
+                    else:
+                        self._rerank_scores.move_to_end((key, hit["id"]))
+                        hit["rerank_score"] = score
+
+        if todo:
+            scores = self._get_cross_encoder().predict([(q, hit["text"]) for q, _, hit in todo])
+            with self._rerank_lock:
+                for (_, key, hit), score in zip(todo, scores):
+                    hit["rerank_score"] = float(score)
+                    self._rerank_scores[(key, hit["id"])] = float(score)
+                while len(self._rerank_scores) > RERANK_CACHE_SIZE:
+                    self._rerank_scores.popitem(last=False)
+        print(f"Reranked {sum(len(h) for h in candidates)} candidates ({len(todo)} scored, rest cached).")
+
+        return [sorted(hits, key=lambda h: h["rerank_score"], reverse=True)[:top_k]
+                for hits in candidates]
+
+    def retrieve_documents(self, query, top_k=5, module=None, rerank=False, candidates=None,
+                           hybrid=False):
+        """
+        Retrieve the top_k most relevant documents from the vector index based on the query.
 
         Args:
             query (str): The query string.
             top_k (int): The number of documents to retrieve.
+            module (str): Only search chunks of this module code (None = all).
+            rerank (bool): Rerank a wider candidate set with the cross-encoder.
+            candidates (int): Candidates fetched for reranking (default 4 × top_k).
+            hybrid (bool): Fuse BM25 and vector rankings.
 
         Returns:
             list or str: A list of dictionaries containing the retrieved documents and their metadata,
                         or a string message if the collection doesn't exist.
         """
-        # Check if collection exists
-        if not self.collection_exists():
-            return f"Collection '{self.collection_name}' does not exist in the database."
+        print(f"Querying collection '{self.collection_name}' for: '{query}'...")
+        results = self.retrieve_many([query], top_k=top_k, module=module,
+                                     rerank=rerank, candidates=candidates, hybrid=hybrid)
+        return results if isinstance(results, str) else results[0]
 
-        try:
-            # Get the collection
-            chroma_collection = self.chroma_client.get_collection(name=self.collection_name)
+    def _fuse(self, vector_hits, lexical_hits, n_results):
+        """
+        Reciprocal-rank-fuse the vector and BM25 rankings of each query;
+        chunks found only lexically get their text from the vector backend.
+        """
+        known = {hit["id"]: hit for hits in vector_hits for hit in hits}
+        missing = {id_val for hits in lexical_hits for id_val, _ in hits if id_val not in known}
+        texts = self.backend.get_texts(self.collection_name, missing) if missing else {}
+
+        fused_hits = []
+        for v_hits, l_hits in zip(vector_hits, lexical_hits):
+            bm25 = dict(l_hits)
+            fused = reciprocal_rank_fusion([[h["id"] for h in v_hits], [i for i, _ in l_hits]])
+            hits = []
+            for id_val, score in fused:
+                if id_val in known:
+                    hit = dict(known[id_val])
+                elif id_val in texts:
+                    hit = {"id": id_val, "text": texts[id_val], "distance": None}
+                else:
+                    continue
+                hit["fused_score"] = score
+                if id_val in bm25:
+                    hit["bm25"] = bm25[id_val]
+                hits.append(hit)
+            fused_hits.append(hits[:n_results])
+        return fused_hits
+
+    def retrieve_many(self, queries, top_k=5, module=None, rerank=False, candidates=None,
+                      hybrid=False):
+        """
+        Retrieve the top_k most relevant documents for several queries at once:
+        one batched embedding call and one multi-vector backend query.
 
-            print(f"Querying ChromaDB collection '{self.collection_name}' for: '{query}'...")
+        Args:
+            queries (list): The query strings.
+            top_k (int): The number of documents to retrieve per query.
+            module (str): Only search chunks of this module code (None = all).
+            rerank (bool): Rerank a wider candidate set with the cross-encoder
+                           (needs rerank_model_path).
+            candidates (int): Candidates fetched for reranking (default 4 × top_k).
+            hybrid (bool): Also search the BM25 index and fuse both rankings
+                           (reciprocal rank fusion); ignored if the index is missing.
 
+        Returns:
+            list or str: One list of hit dictionaries per query (same order as `queries`),
+                        or a string message if the collection doesn't exist.
+        """
+        if not self.backend.has_collection(self.collection_name):
+            return f"Collection '{self.collection_name}' does not exist in the database."
+        if not queries:
+            return []
+        rerank = rerank and bool(self.rerank_model_path)
+        n_results = (candidates or max(4 * top_k, 10)) if rerank else top_k
+        hybrid = hybrid and self.lexical.ready
+        # each half contributes a few extra candidates to the fusion
+        n_each = max(2 * n_results, 10) if hybrid else n_results
+
+        try:
             # Start the timer
             start_time = datetime.now()
 
-            # Generate embedding for the query
-            query_embedding = self.embed_model.get_query_embedding(query)
+            # Lexical half runs while the queries are embedded
+            lexical_job = self._lexical_pool.submit(
+                lambda: [self.lexical.search(q, n_each, module=module) for q in queries]
+            ) if hybrid else None
 
-            # Perform similarity search in ChromaDB
-            results = chroma_collection.query(
-                query_embeddings=[query_embedding],
-                n_results=top_k,
-                include=["documents", "distances"]
-            )
+            # Generate embeddings for all queries in one batch
+            query_embeddings = self._embed_queries(queries)
+
+            # Perform similarity search in the vector backend
+            retrieved = self.backend.query(self.collection_name, query_embeddings,
+                                           n_each, module=module)
+            if lexical_job:
+                retrieved = self._fuse(retrieved, lexical_job.result(), n_results)
 
             # Calculate and print the time taken for retrieval
             end_time = datetime.now()
             retrieval_time = end_time - start_time
             retrieval_minutes, retrieval_seconds = divmod(retrieval_time.total_seconds(), 60)
-            print(f"Retrieval time: {int(retrieval_minutes)} minutes and {retrieval_seconds:.2f} seconds.")
+            print(f"Retrieval time: {int(retrieval_minutes)} minutes and {retrieval_seconds:.2f} seconds "
+                  f"for {len(queries)} queries.")
 
-            # Process the results
-            retrieved_docs = []
-            for i in range(len(results["ids"][0])):
-                retrieved_docs.append({
-                    "id": results["ids"][0][i],
-                    "text": results["documents"][0][i],
-                    "distance": results["distances"][0][i]
-                })
+            if rerank:
+                retrieved = self._rerank(queries, retrieved, top_k)
 
-            print(f"Retrieved {len(retrieved_docs)} documents.")
-            return retrieved_docs
+            print(f"Retrieved {sum(len(r) for r in retrieved)} documents.")
+            return retrieved
 
         except Exception as e:
             print(f"Error retrieving documents: {e}")
             return f"Error retrieving documents: {str(e)}"
-
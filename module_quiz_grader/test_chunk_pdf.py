@@ -0,0 +1,47 @@
+# test_chunk_pdf.py
+# ────────────────────────────────────────────────────────────
+"""
+Heading detection of the sentence chunker (no PDF or tokenizer needed).
+Usage:
+    python -m pytest test_chunk_pdf.py      (or: python test_chunk_pdf.py)
+"""
+
+from chunk_pdf import iter_sentence_chunks, iter_units
+
+PAGE = """Spotting Phishing Emails
+Attackers often send messages that look like they come from
+Microsoft Support Team and urge you
+to reset your password within the hour. The link in such
+Messages Leads To A Fake Login Page
+that records whatever you type.
+Check The Sender Address
+A display name is easy to fake.
+
+Reporting
+Forward the message to the security team."""
+
+
+def count_words(text):
+    return len(text.split())
+
+
+def test_wrapped_lines_are_not_headings():
+    headings = [u["text"] for u in iter_units(1, PAGE) if u["heading"]]
+    assert headings == ["Spotting Phishing Emails", "Check The Sender Address", "Reporting"]
+
+
+def test_wrapped_paragraph_stays_in_one_chunk():
+    chunks = list(iter_sentence_chunks([PAGE], "PH01", count_words, max_tokens=256, overlap=0))
+    assert [c["text"].split(".")[0] for c in chunks] == [
+        "Spotting Phishing Emails Attackers often send messages that look like they come from "
+        "Microsoft Support Team and urge you to reset your password within the hour",
+        "Check The Sender Address A display name is easy to fake",
+        "Reporting Forward the message to the security team",
+    ]
+    assert "Messages Leads To A Fake Login Page that records whatever you type." in chunks[0]["text"]
+
+
+if __name__ == "__main__":
+    test_wrapped_lines_are_not_headings()
+    test_wrapped_paragraph_stays_in_one_chunk()
+    print("ok")
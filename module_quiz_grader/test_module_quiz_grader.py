@@ -9,7 +9,9 @@ Usage:
 import json, sys, random, requests, datetime, pathlib, textwrap as tw
 
 GRADER_URL = "http://localhost:8000/grade_quiz"
+JOBS_URL   = "http://localhost:8000/jobs"
 random_answers = False         # set False for interactive mode
+use_jobs       = False         # queue a job and long-poll instead of waiting on one request
 
 def load_quiz(path: pathlib.Path):
     with open(path, encoding="utf-8") as f:
@@ -44,7 +46,16 @@ def main():
     print(json.dumps(quiz, indent=2))
     print()
 
-    resp = requests.post(GRADER_URL, json=quiz, timeout=120)
+    if use_jobs:
+        job = requests.post(f"{JOBS_URL}/grade_quiz", json=quiz, timeout=10).json()
+        print(f"Queued job {job['job_id']}")
+        while True:
+            resp = requests.get(f"{JOBS_URL}/{job['job_id']}", params={"wait": 30}, timeout=40)
+            if resp.json().get("status") in ("done", "failed"):
+                break
+            print(f"  … {resp.json().get('status')}")
+    else:
+        resp = requests.post(GRADER_URL, json=quiz, timeout=120)
     print(f"HTTP {resp.status_code}")
     try:
         print(json.dumps(resp.json(), indent=2))
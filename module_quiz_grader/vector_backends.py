@@ -0,0 +1,251 @@
+"""
+vector_backends.py
+─────────────────────────────────────────────────────────
+Storage backends for DocumentRetriever.  Both answer the same calls:
+
+    collection_names()                      -> list of names
+    has_collection(name)                    -> bool
+    has_module(name, module)                -> bool
+    query(name, embeddings, n, module=None) -> one hit list per embedding
+    get_texts(name, ids)                    -> {id: text}
+
+  ChromaBackend – the chromadb PersistentClient written by embed.py.
+  NumpyBackend  – a memory-mapped matrix exported by embed.py
+                  (vectors-<version>.npy + meta.json), searched with one matrix
+                  product + argpartition.  For corpora of a few
+                  thousand chunks this is sub-millisecond and needs
+                  neither chromadb nor SQLite at serving time.
+
+Distances are squared L2 on unit vectors (Chroma's default space), so
+hits from either backend compare the same way.
+"""
+
+import glob
+import json
+import os
+import time
+import numpy as np
+
+# embed.py touches this file inside the db directory after every rebuild;
+# a changed mtime drops the cached collection handles.
+BUILD_STAMP = ".icat_build_stamp"
+
+NUMPY_VECTORS = "vectors.npy"          # exports made before versioned files
+NUMPY_META    = "meta.json"
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+class ChromaBackend:
+    def __init__(self, db_path):
+        """
+        Args:
+            db_path (str): Path to the ChromaDB database
+        """
+        import chromadb
+        self.chroma_client = chromadb.PersistentClient(path=db_path)
+
+        # Resolved collection handles (None = known to be missing), valid
+        # until embed.py touches the build stamp
+        self._collections = {}
+        self._modules = {}
+        self._stamp_path = os.path.join(db_path, BUILD_STAMP)
+        self._stamp = _mtime(self._stamp_path)
+
+    def invalidate(self):
+        """Forget every cached collection handle."""
+        self._collections.clear()
+        self._modules.clear()
+        self._stamp = _mtime(self._stamp_path)
+
+    def _get_collection(self, name):
+        if _mtime(self._stamp_path) != self._stamp:
+            print("Chroma DB was rebuilt, dropping cached collection handles.")
+            self.invalidate()
+
+        if name not in self._collections:
+            try:
+                self._collections[name] = self.chroma_client.get_collection(name=name)
+            except Exception:
+                self._collections[name] = None
+        return self._collections[name]
+
+    def collection_names(self):
+        # list_collections() returns Collection objects, extract names
+        return [col.name for col in self.chroma_client.list_collections()]
+
+    def has_collection(self, name):
+        return self._get_collection(name) is not None
+
+    def has_module(self, name, module):
+        key = (name, module)
+        if key not in self._modules:
+            collection = self._get_collection(name)
+            self._modules[key] = collection is not None and bool(
+                collection.get(where={"module": module}, limit=1, include=[])["ids"]
+            )
+        return self._modules[key]
+
+    def query(self, name, embeddings, n_results, module=None):
+        results = self._get_collection(name).query(
+            query_embeddings=embeddings,
+            n_results=n_results,
+            where={"module": module} if module else None,
+            include=["documents", "distances"]
+        )
+        return [
+            [
+                {
+                    "id": results["ids"][q][i],
+                    "text": results["documents"][q][i],
+                    "distance": results["distances"][q][i]
+                }
+                for i in range(len(results["ids"][q]))
+            ]
+            for q in range(len(embeddings))
+        ]
+
+    def get_texts(self, name, ids):
+        found = self._get_collection(name).get(ids=list(ids), include=["documents"])
+        return dict(zip(found["ids"], found["documents"]))
+
+
+class NumpyBackend:
+    COLLECTION = "all_projects"
+
+    def __init__(self, index_dir):
+        """
+        Args:
+            index_dir (str): Directory holding meta.json and the vectors file it names
+        """
+        self.index_dir = index_dir
+        self._meta_path = os.path.join(index_dir, NUMPY_META)
+        self._loaded = None
+        self._load()
+
+    def invalidate(self):
+        self._loaded = None
+        self._load()
+
+    def _load(self):
+        """(Re)map the index whenever embed.py rewrites meta.json."""
+        mtime = _mtime(self._meta_path)
+        if mtime is None or mtime == self._loaded:
+            return
+        with open(self._meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+        vectors = np.load(os.path.join(self.index_dir, meta.get("vectors", NUMPY_VECTORS)),
+                          mmap_mode="r")
+        if vectors.shape[0] != len(meta["ids"]):
+            print("NumPy index is being rewritten, keeping the previous one.")
+            return
+        self.vectors = vectors
+        # float32 memmaps are used in place; float16 ones are upcast once here
+        self._matrix = np.asarray(vectors, dtype=np.float32)
+        self.ids = meta["ids"]
+        self.texts = meta["texts"]
+        self.modules = np.asarray(meta["modules"])
+        self._row = {id_val: row for row, id_val in enumerate(self.ids)}
+        self._loaded = mtime
+        print(f"Mapped NumPy index: {vectors.shape[0]} × {vectors.shape[1]} ({vectors.dtype}).")
+
+    def collection_names(self):
+        self._load()
+        return [self.COLLECTION] if self._loaded else []
+
+    def has_collection(self, name):
+        self._load()
+        return name == self.COLLECTION and self._loaded is not None
+
+    def has_module(self, name, module):
+        return self.has_collection(name) and bool((self.modules == module).any())
+
+    def query(self, name, embeddings, n_results, module=None):
+        self._load()
+        queries = np.asarray(embeddings, dtype=np.float32)
+        scores = queries @ self._matrix.T        # (n_queries, n_chunks)
+        if module:
+            scores[:, self.modules != module] = -np.inf
+
+        n_valid = int(np.isfinite(scores[0]).sum()) if len(scores) else 0
+        k = min(n_results, n_valid)
+        if k == 0:
+            return [[] for _ in range(len(queries))]
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+
+        hits = []
+        for q in range(len(queries)):
+            best = top[q][np.argsort(-scores[q, top[q]])]
+            hits.append([
+                {"id": self.ids[i], "text": self.texts[i],
+                 "distance": float(2.0 - 2.0 * scores[q, i])}
+                for i in best
+            ])
+        return hits
+
+    def get_texts(self, name, ids):
+        self._load()
+        return {id_val: self.texts[self._row[id_val]] for id_val in ids if id_val in self._row}
+
+
+def _replace(src, dst, attempts=10):
+    """os.replace, retried while a reader briefly holds dst open (Windows)."""
+    for attempt in range(attempts):
+        try:
+            return os.replace(src, dst)
+        except PermissionError:
+            if attempt == attempts - 1:
+                raise
+            time.sleep(0.1)
+
+
+def _remove_old_vectors(index_dir, keep):
+    """Delete earlier exports; one still mapped by a service (Windows) goes next time."""
+    for path in glob.glob(os.path.join(index_dir, "vectors*.npy")):
+        if os.path.basename(path) != keep:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def export_numpy_index(collection, index_dir, dtype="float32", page_size=1000):
+    """
+    Write a Chroma collection out as a NumPy index, page by page into a
+    memory-mapped file.  Every export gets a new vectors-<version>.npy, so
+    the file a running service has mapped is never replaced (Windows can't
+    replace a mapped file); meta.json, written last, names the current one
+    and readers reload on it.
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    total = collection.count()
+    first = collection.get(limit=1, include=["embeddings"])
+    dim = len(first["embeddings"][0]) if total else 0
+
+    vectors_name = f"vectors-{time.time_ns()}.npy"
+    vectors_path = os.path.join(index_dir, vectors_name)
+    vectors = np.lib.format.open_memmap(vectors_path, mode="w+", dtype=dtype, shape=(total, dim))
+    ids, texts, modules = [], [], []
+    for offset in range(0, total, page_size):
+        page = collection.get(limit=page_size, offset=offset,
+                              include=["embeddings", "documents", "metadatas"])
+        n = len(page["ids"])
+        vectors[len(ids):len(ids) + n] = np.asarray(page["embeddings"], dtype=dtype)
+        ids.extend(page["ids"])
+        texts.extend(page["documents"])
+        modules.extend((meta or {}).get("module", "") for meta in page["metadatas"])
+    vectors.flush()
+    del vectors
+
+    tmp_meta = os.path.join(index_dir, NUMPY_META + ".tmp")
+    with open(tmp_meta, "w", encoding="utf-8") as f:
+        json.dump({"vectors": vectors_name, "ids": ids, "texts": texts, "modules": modules},
+                  f, ensure_ascii=False)
+    _replace(tmp_meta, os.path.join(index_dir, NUMPY_META))
+    _remove_old_vectors(index_dir, keep=vectors_name)
+    print(f"Exported {len(ids)} vectors ({dtype}) → {index_dir}")
@@ -0,0 +1,253 @@
+"""
+campaign_queue.py  –  durable, resumable send queue for phishing campaigns
+
+Every campaign is a row in `campaigns` (scenario tag + the compiled
+templates it was rendered with) and every recipient a row in
+`recipients`, keyed by (campaign, email) so loading the same address
+twice is a no-op.  A recipient moves through
+
+    pending ─▶ sending ─▶ sent
+                 │  ▲
+                 ▼  │ (transient SMTP error, exponential backoff)
+              retrying ─▶ failed   (permanent error / out of attempts)
+
+and the state is committed as each send finishes, so a crash or Ctrl-C
+loses nothing: `python send_phish.py --resume <campaign id>` picks up
+the pending/retrying rows with the same templates and tokens.  Rows
+caught in 'sending' by a hard crash are queued again on resume (at most
+2 × SMTP_WORKERS of them, which may therefore be delivered twice).
+
+An SMTP connect/login failure (smtp_pool.ConnectFailed) is about the
+relay or the credentials, not the recipient: it stops the run and leaves
+the unsent rows pending instead of burning their attempts.
+"""
+
+import csv, json, os, random, smtplib, sqlite3, time, uuid
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from pathlib import Path
+from smtp_pool import ConnectFailed
+
+# ─────────────────── config ────────────────────────────
+CAMPAIGN_DB       = os.getenv("CAMPAIGN_DB", "campaigns.sqlite3")
+SEND_MAX_ATTEMPTS = int(os.getenv("SEND_MAX_ATTEMPTS", "5"))
+BACKOFF_BASE      = float(os.getenv("SEND_BACKOFF_BASE", "30"))    # seconds, doubled per attempt
+BACKOFF_MAX       = float(os.getenv("SEND_BACKOFF_MAX", "1800"))
+INSERT_BATCH      = 1000                                          # recipients per INSERT
+
+
+# ────────────────── recipients ─────────────────────────
+def iter_recipients(path):
+    """
+    Stream (email, first name or None) from a .txt file (one address per
+    line, '#' comments allowed) or a .csv with an 'email' column and an
+    optional 'first_name' column.  Nothing is held in memory.
+    """
+    path = Path(path)
+    with path.open(newline="", encoding="utf-8-sig") as fh:
+        if path.suffix.lower() == ".csv":
+            reader = csv.DictReader(fh)
+            columns = {name.strip().lower(): name for name in reader.fieldnames or []}
+            email_col = columns.get("email") or (reader.fieldnames or [None])[0]
+            name_col = columns.get("first_name")
+            for row in reader:
+                yield row.get(email_col) or "", (row.get(name_col) or None) if name_col else None
+        else:
+            for line in fh:
+                line = line.split("#", 1)[0]
+                if line.strip():
+                    yield line, None
+
+
+def normalize(email: str) -> str:
+    return email.strip().strip("<>").lower()
+
+
+# ────────────────── transient vs permanent ─────────────
+def is_transient(exc: Exception) -> bool:
+    """4xx replies and dropped connections are worth retrying; 5xx are not."""
+    if isinstance(exc, smtplib.SMTPRecipientsRefused):
+        return all(400 <= code < 500 for code, _ in exc.recipients.values())
+    if isinstance(exc, smtplib.SMTPResponseException):
+        return 400 <= exc.smtp_code < 500
+    if isinstance(exc, smtplib.SMTPServerDisconnected):
+        return True
+    # SMTPException subclasses OSError; anything else from smtplib is our fault
+    return isinstance(exc, OSError) and not isinstance(exc, smtplib.SMTPException)
+
+
+def backoff(attempts: int) -> float:
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** max(attempts - 1, 0))
+    return delay * random.uniform(0.8, 1.2)
+
+
+class CampaignQueue:
+    def __init__(self, path=CAMPAIGN_DB):
+        self._db = sqlite3.connect(path)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS campaigns (
+                id TEXT PRIMARY KEY, scenario TEXT NOT NULL,
+                templates TEXT NOT NULL, created REAL NOT NULL);
+            CREATE TABLE IF NOT EXISTS recipients (
+                campaign TEXT NOT NULL, email TEXT NOT NULL, first_name TEXT,
+                token TEXT NOT NULL, state TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0, not_before REAL NOT NULL DEFAULT 0,
+                error TEXT, sent_at REAL,
+                PRIMARY KEY (campaign, email));
+            CREATE INDEX IF NOT EXISTS recipients_due ON recipients(campaign, state, not_before);
+            CREATE UNIQUE INDEX IF NOT EXISTS recipients_token ON recipients(token);
+        """)
+        self._db.commit()
+
+    # ─── campaigns ─────────────────────────────────────
+    def create(self, scenario: str, templates) -> str:
+        campaign_id = uuid.uuid4().hex[:12]
+        self._db.execute(
+            "INSERT INTO campaigns (id, scenario, templates, created) VALUES (?, ?, ?, ?)",
+            (campaign_id, scenario, json.dumps([t.to_dict() for t in templates]), time.time()))
+        self._db.commit()
+        return campaign_id
+
+    def campaign(self, campaign_id: str):
+        """(scenario tag, [template dicts]) or None."""
+        row = self._db.execute("SELECT scenario, templates FROM campaigns WHERE id = ?",
+                               (campaign_id,)).fetchone()
+        return (row[0], json.loads(row[1])) if row else None
+
+    def add_recipients(self, campaign_id: str, rows) -> int:
+        """Insert (email, first name) rows in batches; duplicates are ignored. Returns rows added."""
+        before = self._db.total_changes
+        batch = []
+        for email, first_name in rows:
+            email = normalize(email)
+            if "@" not in email:
+                continue
+            batch.append((campaign_id, email, first_name, uuid.uuid4().hex))
+            if len(batch) >= INSERT_BATCH:
+                self._insert(batch)
+                batch = []
+        if batch:
+            self._insert(batch)
+        return self._db.total_changes - before
+
+    def _insert(self, batch):
+        self._db.executemany(
+            "INSERT OR IGNORE INTO recipients (campaign, email, first_name, token) VALUES (?, ?, ?, ?)",
+            batch)
+        self._db.commit()
+
+    # ─── state ─────────────────────────────────────────
+    def recover(self, campaign_id: str) -> int:
+        """Queue rows a dead run left in 'sending'."""
+        cur = self._db.execute("UPDATE recipients SET state = 'pending'"
+                               " WHERE campaign = ? AND state = 'sending'", (campaign_id,))
+        self._db.commit()
+        return cur.rowcount
+
+    def claim(self, campaign_id: str, limit: int):
+        """Mark up to `limit` due recipients 'sending' and return them as dicts."""
+        rows = self._db.execute(
+            "SELECT email, first_name, token, attempts FROM recipients"
+            " WHERE campaign = ? AND state IN ('pending', 'retrying') AND not_before <= ?"
+            " ORDER BY not_before, rowid LIMIT ?", (campaign_id, time.time(), limit)).fetchall()
+        self._db.executemany("UPDATE recipients SET state = 'sending' WHERE campaign = ? AND email = ?",
+                             [(campaign_id, r[0]) for r in rows])
+        self._db.commit()
+        return [dict(zip(("email", "first_name", "token", "attempts"), r)) for r in rows]
+
+    def release(self, campaign_id: str, email: str):
+        """Put a claimed recipient back untouched (send never started)."""
+        self._db.execute("UPDATE recipients SET state = 'pending' WHERE campaign = ? AND email = ?",
+                         (campaign_id, email))
+        self._db.commit()
+
+    def mark_sent(self, campaign_id: str, email: str):
+        self._db.execute(
+            "UPDATE recipients SET state = 'sent', attempts = attempts + 1, sent_at = ?, error = NULL"
+            " WHERE campaign = ? AND email = ?", (time.time(), campaign_id, email))
+        self._db.commit()
+
+    def mark_error(self, campaign_id: str, row: dict, exc: Exception) -> str:
+        """Record a failed send; returns the new state ('retrying' or 'failed')."""
+        attempts = row["attempts"] + 1
+        retry = is_transient(exc) and attempts < SEND_MAX_ATTEMPTS
+        state = "retrying" if retry else "failed"
+        self._db.execute(
+            "UPDATE recipients SET state = ?, attempts = ?, not_before = ?, error = ?"
+            " WHERE campaign = ? AND email = ?",
+            (state, attempts, time.time() + backoff(attempts) if retry else 0, str(exc),
+             campaign_id, row["email"]))
+        self._db.commit()
+        return state
+
+    def next_due(self, campaign_id: str):
+        """Seconds until the next retrying row is due, or None if nothing is left to send."""
+        row = self._db.execute(
+            "SELECT MIN(not_before) FROM recipients WHERE campaign = ? AND state IN ('pending', 'retrying')",
+            (campaign_id,)).fetchone()
+        return None if row[0] is None else max(0.0, row[0] - time.time())
+
+    def counts(self, campaign_id: str) -> dict:
+        return dict(self._db.execute("SELECT state, COUNT(*) FROM recipients WHERE campaign = ?"
+                                     " GROUP BY state", (campaign_id,)).fetchall())
+
+    def close(self):
+        self._db.close()
+
+
+# ────────────────── runner ─────────────────────────────
+def drain(queue: CampaignQueue, campaign_id: str, send, workers: int, on_result=None):
+    """
+    Send every due recipient of the campaign with `workers` threads, until
+    nothing is pending or retrying.  send(row) does the SMTP work;
+    on_result(row, exc or None, state) is called on this thread after the
+    row's state is committed.  Ctrl-C or a ConnectFailed stops claiming,
+    puts unstarted rows back, waits for the in-flight sends to be
+    recorded, and re-raises.
+    """
+    in_flight = {}
+    with ThreadPoolExecutor(max_workers=workers) as senders:
+        try:
+            while True:
+                # keep a short backlog so claimed-but-unstarted rows stay few
+                room = workers * 2 - len(in_flight)
+                if room > 0:
+                    for row in queue.claim(campaign_id, room):
+                        in_flight[senders.submit(send, row)] = row
+                if not in_flight:
+                    delay = queue.next_due(campaign_id)
+                    if delay is None:
+                        break
+                    time.sleep(min(delay, BACKOFF_MAX))
+                    continue
+                done, _ = wait(in_flight, timeout=1.0, return_when=FIRST_COMPLETED)
+                fatal = None
+                for fut in done:
+                    _record(queue, campaign_id, in_flight.pop(fut), fut, on_result)
+                    if isinstance(fut.exception(), ConnectFailed):
+                        fatal = fut.exception()
+                if fatal is not None:
+                    raise fatal
+        except (KeyboardInterrupt, ConnectFailed):
+            for fut, row in list(in_flight.items()):
+                if fut.cancel():
+                    queue.release(campaign_id, row["email"])
+                    del in_flight[fut]
+            for fut in wait(in_flight).done:
+                _record(queue, campaign_id, in_flight[fut], fut, on_result)
+            raise
+
+
+def _record(queue, campaign_id, row, fut, on_result):
+    exc = fut.exception()
+    if isinstance(exc, ConnectFailed):
+        queue.release(campaign_id, row["email"])     # never attempted; not this row's fault
+        return
+    if exc is None:
+        queue.mark_sent(campaign_id, row["email"])
+        state = "sent"
+    else:
+        state = queue.mark_error(campaign_id, row, exc)
+    if on_result is not None:
+        on_result(row, exc, state)
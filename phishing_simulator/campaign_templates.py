@@ -0,0 +1,92 @@
+"""
+campaign_templates.py  –  render a scenario once, personalize per recipient
+
+The LLM writes a handful of HTML variants per scenario at campaign start.
+Each variant is compiled once: the scenario's button label becomes the
+tracking link, and the text is split around its <<NAME>> / <<LINK>> slots.
+Personalizing a recipient is then a single join over those pieces.
+"""
+
+import html, re
+
+SLOTS = ("<<NAME>>", "<<LINK>>")
+_SLOT = re.compile("(" + "|".join(map(re.escape, SLOTS)) + ")")
+_FENCE = re.compile(r"^```(?:html)?\s*(.*?)\s*```$", re.S | re.I)
+
+BUTTON_STYLE = ("padding:10px 20px;background:#0063ce;color:#fff;"
+                "text-decoration:none;border-radius:4px;")
+
+
+def _label_words(label: str) -> str:
+    # any whitespace or &nbsp; between the words of the label
+    return r"(?:\s|&nbsp;)+".join(map(re.escape, label.split()))
+
+
+def link_button(html_body: str, label: str) -> str:
+    """
+    Turn the scenario's button into the <<LINK>> anchor: the bold label the
+    seed asks for (<b>Label</b>, any case), else the exact label text, else
+    an appended button if the model reworded it.
+    """
+    anchor = (f"<a href='<<LINK>>' style='{BUTTON_STYLE}'>"
+              f"{label.replace(' ', '&nbsp;')}</a>")
+    words = _label_words(label)
+    for pattern in (re.compile(rf"<(b|strong)>\s*{words}\s*</\1>", re.I), re.compile(words)):
+        linked, count = pattern.subn(anchor, html_body)
+        if count:
+            return linked
+    lower = html_body.lower()
+    if "</body>" in lower:
+        at = lower.rindex("</body>")
+        return html_body[:at] + f"<p>{anchor}</p>" + html_body[at:]
+    return html_body + f"<p>{anchor}</p>"
+
+
+class CompiledTemplate:
+    """
+    A subject + HTML body with <<NAME>> and <<LINK>> slots, pre-split.
+    With button=None the body is taken as already compiled (see to_dict).
+    """
+
+    def __init__(self, tag: str, subject: str, html_body: str, button: str = None):
+        self.tag = tag
+        if button is None:
+            self.source = html_body
+        else:
+            self.source = link_button(_FENCE.sub(r"\1", html_body.strip()), button)
+        self.subject_source = subject
+        self._body = _SLOT.split(self.source)
+        self._subject = _SLOT.split(subject)
+
+    @staticmethod
+    def _fill(parts, values):
+        # odd indices are slot names, even ones literal text
+        return "".join(values[p] if i % 2 else p for i, p in enumerate(parts))
+
+    def to_dict(self) -> dict:
+        return {"tag": self.tag, "subject": self.subject_source, "html": self.source}
+
+    @classmethod
+    def from_dict(cls, d: dict):
+        return cls(d["tag"], d["subject"], d["html"])
+
+    def render(self, first_name: str, link: str):
+        """Return (subject, html body) for one recipient."""
+        values = {"<<NAME>>": html.escape(first_name), "<<LINK>>": html.escape(link, quote=True)}
+        subject = self._fill(self._subject, {"<<NAME>>": first_name, "<<LINK>>": link})
+        return subject, self._fill(self._body, values)
+
+
+def prepare_templates(scenario: dict, generate, variants: int = 3):
+    """
+    Generate `variants` bodies for the scenario with generate(seed) -> html
+    (one LLM call each) and compile them.
+    """
+    return [CompiledTemplate(scenario["tag"], scenario["subject"],
+                             generate(scenario["seed"]), scenario["button"])
+            for _ in range(max(1, variants))]
+
+
+def pick_template(templates, recipient: str):
+    """Same recipient → same variant, spread evenly over the variants."""
+    return templates[sum(recipient.lower().encode("utf-8")) % len(templates)]
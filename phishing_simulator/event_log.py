@@ -0,0 +1,260 @@
+"""
+event_log.py  –  buffered, indexed storage for campaign send events
+
+Two interchangeable backends (EVENT_LOG):
+
+  sqlite – events table in EVENT_DB (WAL) with indexes on token,
+           recipient, scenario and (campaign, recipient); answers the
+           reporting queries below in milliseconds at millions of rows.
+                                                               (default)
+  jsonl  – the original phish_send_log.jsonl format, written through one
+           open file handle instead of an open/close per event.
+
+Both buffer events and flush every EVENT_FLUSH_LINES events or
+EVENT_FLUSH_EVERY seconds (a daemon thread covers quiet periods), and on
+close().  Readers such as track_clicks.py follow new events with
+read_since(cursor).
+
+    python event_log.py import phish_send_log.jsonl   # old log → sqlite
+    python event_log.py export phish_send_log.jsonl   # sqlite → old format
+    python event_log.py unsent <campaign id>
+    python event_log.py tokens <scenario tag>
+"""
+
+import argparse, json, os, sqlite3, threading
+from pathlib import Path
+
+# ─────────────────── config ────────────────────────────
+EVENT_LOG         = os.getenv("EVENT_LOG", "sqlite")
+EVENT_DB          = os.getenv("EVENT_DB", "phish_events.sqlite3")
+EVENT_JSONL       = os.getenv("EVENT_JSONL", "phish_send_log.jsonl")
+EVENT_FLUSH_EVERY = float(os.getenv("EVENT_FLUSH_EVERY", "2"))   # seconds
+EVENT_FLUSH_LINES = int(os.getenv("EVENT_FLUSH_LINES", "200"))
+
+COLUMNS = ("time", "campaign", "scenario", "recipient", "token")
+
+
+class _Buffered:
+    """Buffering + periodic flush shared by both backends."""
+
+    def __init__(self):
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._flusher = None
+
+    def _start_flusher(self):
+        def loop():
+            while not self._closed.wait(EVENT_FLUSH_EVERY):
+                self.flush()
+        self._flusher = threading.Thread(target=loop, name="event-log-flush", daemon=True)
+        self._flusher.start()
+
+    def write(self, **event):
+        """Queue one event: time, campaign, scenario, to, token, …"""
+        if self._flusher is None:
+            self._start_flusher()
+        with self._lock:
+            self._buffer.append(event)
+            full = len(self._buffer) >= EVENT_FLUSH_LINES
+        if full:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            batch, self._buffer = self._buffer, []
+            if batch:
+                self._write_batch(batch)
+
+    def close(self):
+        self._closed.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# ────────────────── JSONL backend ──────────────────────
+class JsonlEventLog(_Buffered):
+    def __init__(self, path=EVENT_JSONL):
+        super().__init__()
+        self.path = Path(path)
+        self._fh = None
+
+    def _write_batch(self, batch):
+        if self._fh is None:
+            self._fh = self.path.open("a", encoding="utf-8")
+        self._fh.write("".join(json.dumps(e) + "\n" for e in batch))
+        self._fh.flush()
+
+    def close(self):
+        super().close()
+        if self._fh is not None:
+            self._fh.close()
+
+    def read_since(self, cursor=0):
+        """(events appended after byte offset `cursor`, new cursor)."""
+        if not self.path.exists():
+            return [], 0
+        if self.path.stat().st_size < cursor:         # rotated
+            cursor = 0
+        events = []
+        with self.path.open("rb") as fh:
+            fh.seek(cursor)
+            for line in fh:
+                if not line.endswith(b"\n"):           # half-written; read it next time
+                    break
+                cursor += len(line)
+                try:
+                    events.append(json.loads(line))
+                except ValueError:
+                    continue
+        return events, cursor
+
+
+# ────────────────── SQLite backend ─────────────────────
+class SqliteEventLog(_Buffered):
+    def __init__(self, path=EVENT_DB):
+        super().__init__()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS events (
+                id INTEGER PRIMARY KEY, time TEXT, campaign TEXT, scenario TEXT,
+                recipient TEXT, token TEXT, extra TEXT);
+            CREATE INDEX IF NOT EXISTS events_token ON events(token);
+            CREATE INDEX IF NOT EXISTS events_recipient ON events(recipient);
+            CREATE INDEX IF NOT EXISTS events_scenario ON events(scenario);
+            CREATE INDEX IF NOT EXISTS events_campaign ON events(campaign, recipient);
+        """)
+        self._db.commit()
+
+    @staticmethod
+    def _row(event: dict):
+        event = dict(event)
+        event["recipient"] = event.pop("to", event.get("recipient"))
+        values = [event.pop(c, None) for c in COLUMNS]
+        return (*values, json.dumps(event) if event else None)
+
+    @staticmethod
+    def _event(row) -> dict:
+        *values, extra = row
+        event = {("to" if c == "recipient" else c): v for c, v in zip(COLUMNS, values) if v is not None}
+        return {**event, **json.loads(extra)} if extra else event
+
+    def _write_batch(self, batch):
+        self._db.executemany(
+            "INSERT INTO events (time, campaign, scenario, recipient, token, extra)"
+            " VALUES (?, ?, ?, ?, ?, ?)", [self._row(e) for e in batch])
+        self._db.commit()
+
+    def close(self):
+        super().close()
+        self._db.close()
+
+    def read_since(self, cursor=0):
+        """(events with rowid > `cursor`, new cursor)."""
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT id, {', '.join(COLUMNS)}, extra FROM events WHERE id > ? ORDER BY id",
+                (cursor,)).fetchall()
+        return [self._event(r[1:]) for r in rows], (rows[-1][0] if rows else cursor)
+
+    # ─── reporting ─────────────────────────────────────
+    def tokens_for_scenario(self, scenario: str):
+        with self._lock:
+            return [r[0] for r in self._db.execute(
+                "SELECT token FROM events WHERE scenario = ?", (scenario,))]
+
+    def events_for(self, token=None, recipient=None):
+        column, value = ("token", token) if token is not None else ("recipient", recipient)
+        with self._lock:
+            rows = self._db.execute(f"SELECT {', '.join(COLUMNS)}, extra FROM events"
+                                    f" WHERE {column} = ? ORDER BY id", (value,)).fetchall()
+        return [self._event(r) for r in rows]
+
+    def unsent(self, campaign_id: str, campaign_db=None):
+        """Recipients queued for the campaign (campaign_queue.py) with no send event yet."""
+        if campaign_db is None:
+            from campaign_queue import CAMPAIGN_DB as campaign_db
+        with self._lock:
+            self._db.execute("ATTACH DATABASE ? AS queue", (campaign_db,))
+            try:
+                return [r[0] for r in self._db.execute(
+                    "SELECT r.email FROM queue.recipients r WHERE r.campaign = ?"
+                    " AND NOT EXISTS (SELECT 1 FROM events e"
+                    "                 WHERE e.campaign = r.campaign AND e.recipient = r.email)",
+                    (campaign_id,))]
+            finally:
+                self._db.execute("DETACH DATABASE queue")
+
+    # ─── JSONL compatibility ───────────────────────────
+    def export_jsonl(self, path) -> int:
+        """Write every event in the original phish_send_log.jsonl format."""
+        n, cursor = 0, 0
+        with open(path, "w", encoding="utf-8") as fh:
+            while True:
+                with self._lock:
+                    rows = self._db.execute(
+                        f"SELECT id, {', '.join(COLUMNS)}, extra FROM events WHERE id > ?"
+                        f" ORDER BY id LIMIT 10000", (cursor,)).fetchall()
+                if not rows:
+                    return n
+                fh.write("".join(json.dumps(self._event(r[1:])) + "\n" for r in rows))
+                n, cursor = n + len(rows), rows[-1][0]
+
+    def import_jsonl(self, path) -> int:
+        """Load an existing JSONL send log, 10k events per transaction."""
+        n, batch = 0, []
+        with open(path, encoding="utf-8") as fh:
+            for line in fh:
+                if line.strip():
+                    batch.append(json.loads(line))
+                if len(batch) >= 10000:
+                    with self._lock:
+                        self._write_batch(batch)
+                    n, batch = n + len(batch), []
+        with self._lock:
+            if batch:
+                self._write_batch(batch)
+        return n + len(batch)
+
+
+def open_event_log(kind=None):
+    """The configured backend (EVENT_LOG=sqlite|jsonl)."""
+    kind = kind or EVENT_LOG
+    if kind == "jsonl":
+        return JsonlEventLog()
+    if kind == "sqlite":
+        return SqliteEventLog()
+    raise ValueError(f"Unknown EVENT_LOG {kind!r} (expected 'sqlite' or 'jsonl')")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query or convert the send-event log.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("import", help="load a JSONL send log into EVENT_DB").add_argument("path")
+    sub.add_parser("export", help="write EVENT_DB as JSONL").add_argument("path")
+    sub.add_parser("unsent", help="queued recipients not sent yet").add_argument("campaign")
+    sub.add_parser("tokens", help="tokens sent for a scenario").add_argument("scenario")
+    args = parser.parse_args()
+
+    with SqliteEventLog() as log:
+        if args.command == "import":
+            print(f"Imported {log.import_jsonl(args.path)} events into {EVENT_DB}")
+        elif args.command == "export":
+            print(f"Exported {log.export_jsonl(args.path)} events to {args.path}")
+        elif args.command == "unsent":
+            print("\n".join(log.unsent(args.campaign)))
+        else:
+            print("\n".join(log.tokens_for_scenario(args.scenario)))
+
+
+if __name__ == "__main__":
+    main()
@@ -3,10 +3,21 @@ send_phish.py  –  generate & send a simulated phishing e-mail
 
 Usage:
     python send_phish.py alice@example.com bob@example.com
-    (or put addresses in recipients.txt and read from there)
+    python send_phish.py --file employees.csv
+    (with neither, addresses are read from recipients.txt)
+    python send_phish.py --resume <campaign id>
+
+Campaigns are queued in campaigns.sqlite3 (see campaign_queue.py), so an
+interrupted run can be resumed without sending anyone a second e-mail.
+Send events go to the event log (event_log.py; SQLite by default,
+EVENT_LOG=jsonl for the old phish_send_log.jsonl).
+
+The scenario is rendered TEMPLATE_VARIANTS times per campaign, not per
+recipient; see campaign_templates.py.  Mail goes out over SMTP_WORKERS
+pooled sessions at up to SMTP_RATE messages/second; see smtp_pool.py.
 """
 
-import smtplib, uuid, sys, json
+import argparse, sys
 from email.message import EmailMessage
 from pathlib import Path
 from datetime import datetime
@@ -14,6 +25,10 @@ from dotenv import load_dotenv
 from rich import print
 from ollama import Client
 import os, random, textwrap as tw
+from campaign_templates import CompiledTemplate, prepare_templates, pick_template
+from campaign_queue import CampaignQueue, drain, iter_recipients
+from event_log import open_event_log
+from smtp_pool import ConnectFailed, SmtpPool, SMTP_WORKERS
 
 # ─────────────────── config ────────────────────────────
 load_dotenv()
@@ -29,17 +44,17 @@ FROM_EMAIL = os.getenv("FROM_EMAIL")
 OLLAMA_HOST  = os.getenv("OLLAMA_HOST", "http://127.0.0.1:11434")
 OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "qwen2.5:7b")
 LINK_URL     = os.getenv("LINK_URL", "https://google.com")
+TEMPLATE_VARIANTS = int(os.getenv("TEMPLATE_VARIANTS", "3"))   # LLM renders per campaign
 
 client = Client(host=OLLAMA_HOST)
 
-LOG_FILE = Path("phish_send_log.jsonl")
-
-# ────────────────── scenario templates ─────────────────
 # ────────────────── scenario templates ─────────────────
+# "button" is the label the seed asks for; it becomes the tracking link
 SCENARIOS = [
     # 1 ─ VPN password reset
     {
       "tag": "vpn_reset",
+      "button": "Reset Now",
       "subject": "URGENT: VPN password reset required",
       "seed": """
 Write a professional phishing email that appears to come from the company
@@ -55,6 +70,7 @@ Return ONLY the raw HTML for the email body, with no explanation or markdown fen
     # 2 ─ Session re-authentication
     {
       "tag": "account_reauth",
+      "button": "Sign In",
       "subject": "Session expired – re-authenticate your corporate account",
       "seed": """
 Compose a friendly but time-sensitive email telling the employee their
@@ -68,6 +84,7 @@ Return ONLY the raw HTML for the email body, with no explanation or markdown fen
     # 3 ─ Payroll update lure
     {
       "tag": "payroll_update",
+      "button": "Verify Details",
       "subject": "Action needed: Payroll information verification",
       "seed": """
 Craft a realistic email from the HR payroll department asking the employee
@@ -81,6 +98,7 @@ Return ONLY the raw HTML for the email body, with no explanation or markdown fen
     # 4 ─ Fake OneDrive share
     {
       "tag": "onedrive_share",
+      "button": "Open Document",
       "subject": "<<NAME>>, a file has been shared with you on OneDrive",
       "seed": """
 Write a convincing share-notification that looks like Microsoft OneDrive.
@@ -94,6 +112,7 @@ Return ONLY the raw HTML for the email body, with no explanation or markdown fen
     # 5 ─ Tax compliance notice
     {
       "tag": "tax_compliance",
+      "button": "Review Form",
       "subject": "Important: Digital tax form signature required",
       "seed": """
 Create an urgent but polite email from “Finance Compliance” stating that
@@ -107,6 +126,7 @@ Return ONLY the raw HTML for the email body, with no explanation or markdown fen
     # 6 ─ Benefits enrollment reminder
     {
       "tag": "benefits_enroll",
+      "button": "Confirm Enrollment",
       "subject": "Open enrollment closes Friday – confirm your selections",
       "seed": """
 Draft a benefits-team email reminding employees that open enrollment ends
@@ -120,6 +140,7 @@ Return ONLY the raw HTML for the email body, with no explanation or markdown fen
     # 7 ─ Software-license termination scare
     {
       "tag": "license_termination",
+      "button": "Re-Validate License",
       "subject": "Software license termination notice – immediate action required",
       "seed": """
 Write a slightly technical email pretending to be from the “Software Asset
@@ -133,6 +154,7 @@ Return ONLY the raw HTML for the email body, with no explanation or markdown fen
     # 8 ─ Parcel-delivery scam (highly relatable)
     {
       "tag": "parcel_delivery",
+      "button": "Pay Fee",
       "subject": "Package held at customs – confirm shipping fee",
       "seed": """
 Compose an email that appears to come from an international parcel service
@@ -146,6 +168,7 @@ Return ONLY the raw HTML for the email body, with no explanation or markdown fen
     # 9 ─ Calendar invite update
     {
       "tag": "calendar_update",
+      "button": "Accept New Time",
       "subject": "<<NAME>>, meeting time changed – please reconfirm",
       "seed": """
 Create an Outlook-style meeting update stating that tomorrow’s “Project
@@ -159,6 +182,7 @@ Return ONLY the raw HTML for the email body, with no explanation or markdown fen
     # 10 ─ Teams voicemail notice
     {
       "tag": "teams_voicemail",
+      "button": "Play Voicemail",
       "subject": "You have 1 unread Teams voicemail",
       "seed": """
 Generate a Microsoft Teams notification email telling <<NAME>> they missed
@@ -173,77 +197,105 @@ Return ONLY the raw HTML for the email body, with no explanation or markdown fen
 def pick_scenario():
     return random.choice(SCENARIOS)
 
-def render_email_body(seed: str, first_name: str):
-    """Call the LLM once; inject <<NAME>> afterwards."""
+def render_email_body(seed: str):
+    """Call the LLM once; <<NAME>> stays in for the template to fill."""
     rsp = client.chat(
         model=OLLAMA_MODEL,
         messages=[{"role": "user", "content": seed}],
         stream=False
     )
-    html = rsp["message"]["content"]
-    return html.replace("<<NAME>>", first_name)
+    return rsp["message"]["content"]
 
-def send_one(recipient: str, html_body: str, subject: str, token: str):
+def send_one(pool: SmtpPool, recipient: str, html_body: str, subject: str):
     msg = EmailMessage()
     msg["From"] = f"{FROM_NAME} <{FROM_EMAIL}>"
     msg["To"]   = recipient
     msg["Subject"] = subject
 
-    # replace the placeholder button label with our link
-    link = f"{LINK_URL}?id={token}"
-    html_body = html_body.replace(
-        "Reset Now", f"<a href='{link}' style='padding:10px 20px;"
-                     f"background:#0063ce;color:#fff;text-decoration:none;"
-                     f"border-radius:4px;'>Reset&nbsp;Now</a>"
-    ).replace(
-        "Sign In",  f"<a href='{link}' style='padding:10px 20px;"
-                     f"background:#0063ce;color:#fff;text-decoration:none;"
-                     f"border-radius:4px;'>Sign&nbsp;In</a>"
-    )
-
     msg.set_content(
         "This message contains HTML. "
         "Please view it in an HTML-capable e-mail client."
     )
     msg.add_alternative(html_body, subtype="html")
 
-    with smtplib.SMTP(SMTP_HOST, SMTP_PORT) as s:
-        s.starttls()
-        s.login(SMTP_USER, SMTP_PASS)
-        s.send_message(msg)
-
-def log_event(**kwargs):
-    with LOG_FILE.open("a", encoding="utf-8") as fh:
-        fh.write(json.dumps(kwargs) + "\n")
+    pool.send(msg)
 
 # ────────────────── main procedure ─────────────────────
-def main():
-    # collect recipients
-    if len(sys.argv) > 1:
-        recipients = sys.argv[1:]
-    elif Path("recipients.txt").exists():
-        recipients = [line.strip() for line in Path("recipients.txt").read_text().splitlines() if line.strip()]
+def new_campaign(queue: CampaignQueue, args):
+    if args.recipients:
+        rows = ((email, None) for email in args.recipients)
+    elif Path(args.file).exists():
+        rows = iter_recipients(args.file)
     else:
         print("[red]No recipients provided.[/red]")
         sys.exit(1)
 
     scenario = pick_scenario()
-    subj     = scenario["subject"]
-
-    for email in recipients:
-        first = email.split("@")[0].split(".")[0].title()  # naive first-name
-        token = uuid.uuid4().hex
-        html  = render_email_body(scenario["seed"], first)
-
-        try:
-            send_one(email, html, subj, token)
-            print(f"[green]✓ sent[/green] {email}  ({scenario['tag']})")
-            log_event(time=datetime.utcnow().isoformat(),
-                      scenario=scenario["tag"],
-                      to=email,
-                      token=token)
-        except Exception as e:
-            print(f"[red]✗ failed[/red] {email} : {e}")
+    print(f"Rendering {TEMPLATE_VARIANTS} variants of '{scenario['tag']}'…")
+    templates = prepare_templates(scenario, render_email_body, TEMPLATE_VARIANTS)
+    campaign_id = queue.create(scenario["tag"], templates)
+    added = queue.add_recipients(campaign_id, rows)
+    print(f"Campaign [bold]{campaign_id}[/bold]: {added} recipients queued")
+    return campaign_id, scenario["tag"], templates
+
+def resume_campaign(queue: CampaignQueue, campaign_id: str):
+    found = queue.campaign(campaign_id)
+    if found is None:
+        print(f"[red]Unknown campaign {campaign_id}.[/red]")
+        sys.exit(1)
+    tag, templates = found
+    requeued = queue.recover(campaign_id)
+    if requeued:
+        print(f"[yellow]{requeued} sends were interrupted mid-flight and will be retried[/yellow]")
+    return campaign_id, tag, [CompiledTemplate.from_dict(t) for t in templates]
+
+def main():
+    parser = argparse.ArgumentParser(description="Send a simulated phishing campaign.")
+    parser.add_argument("recipients", nargs="*", help="addresses (default: read --file)")
+    parser.add_argument("--file", default="recipients.txt", help="recipients .txt or .csv")
+    parser.add_argument("--resume", metavar="CAMPAIGN_ID", help="continue an interrupted campaign")
+    args = parser.parse_args()
+
+    queue = CampaignQueue()
+    events = open_event_log()
+    if args.resume:
+        campaign_id, tag, templates = resume_campaign(queue, args.resume)
+    else:
+        campaign_id, tag, templates = new_campaign(queue, args)
+
+    def send(row):
+        email, token = row["email"], row["token"]
+        first = row["first_name"] or email.split("@")[0].split(".")[0].title()  # naive first-name
+        subj, html = pick_template(templates, email).render(first, f"{LINK_URL}?id={token}")
+        send_one(pool, email, html, subj)
+
+    # called on the main thread once the row's new state is stored
+    def report(row, exc, state):
+        email = row["email"]
+        if exc is None:
+            print(f"[green]✓ sent[/green] {email}  ({tag})")
+            events.write(time=datetime.utcnow().isoformat(),
+                         campaign=campaign_id,
+                         scenario=tag,
+                         to=email,
+                         token=row["token"])
+        elif state == "retrying":
+            print(f"[yellow]↻ retrying[/yellow] {email} : {exc}")
+        else:
+            print(f"[red]✗ failed[/red] {email} : {exc}")
+
+    try:
+        with SmtpPool(SMTP_HOST, SMTP_PORT, SMTP_USER, SMTP_PASS) as pool:
+            drain(queue, campaign_id, send, SMTP_WORKERS, report)
+    except KeyboardInterrupt:
+        print(f"\n[yellow]Interrupted.[/yellow] Resume with: python send_phish.py --resume {campaign_id}")
+    except ConnectFailed as e:
+        print(f"[red]SMTP unavailable, campaign stopped:[/red] {e}\n"
+              f"Unsent recipients are still pending; fix SMTP_* and run: "
+              f"python send_phish.py --resume {campaign_id}")
+    print(f"Campaign {campaign_id}: {queue.counts(campaign_id)}")
+    events.close()
+    queue.close()
 
 if __name__ == "__main__":
     main()
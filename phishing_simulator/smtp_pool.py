@@ -0,0 +1,175 @@
+"""
+smtp_pool.py  –  reusable, authenticated SMTP sessions for campaign sends
+
+Opening a connection, STARTTLS and AUTH for every message dominates send
+time and trips relay login throttles.  SmtpPool keeps up to `size`
+logged-in sessions, hands one to each sending thread, and puts it back
+afterwards.  A session that dropped (or reached SMTP_MAX_PER_SESSION
+messages) is reconnected transparently; the message is retried once on
+a fresh session.
+
+A shared token bucket caps the whole pool at SMTP_RATE messages/second
+(0 = unlimited), however many workers are sending.
+
+Failing to connect, STARTTLS or log in raises ConnectFailed: the relay or
+the credentials are the problem, not the message or its recipient.
+"""
+
+import os, smtplib, ssl, threading, time
+from queue import Queue, Empty
+
+# ─────────────────── config ────────────────────────────
+SMTP_WORKERS         = int(os.getenv("SMTP_WORKERS", "4"))           # parallel senders = sessions
+SMTP_RATE            = float(os.getenv("SMTP_RATE", "5"))            # messages/second, 0 = no limit
+SMTP_MAX_PER_SESSION = int(os.getenv("SMTP_MAX_PER_SESSION", "100")) # reconnect after this many
+SMTP_TIMEOUT         = float(os.getenv("SMTP_TIMEOUT", "30"))
+
+# connection-level failures worth one retry on a new session
+RECONNECT_ERRORS = (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError, ssl.SSLError)
+
+
+class ConnectFailed(Exception):
+    """No SMTP session could be opened; no message was attempted."""
+
+
+class TokenBucket:
+    """Thread-safe rate limiter: acquire() blocks until a token is free."""
+
+    def __init__(self, rate: float, burst: float = None):
+        self.rate = rate
+        self.capacity = burst if burst is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._stamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._stamp) * self.rate)
+                self._stamp = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class _Session:
+    def __init__(self, smtp: smtplib.SMTP):
+        self.smtp = smtp
+        self.sent = 0
+
+
+class SmtpPool:
+    def __init__(self, host, port, user=None, password=None,
+                 size=SMTP_WORKERS, rate=SMTP_RATE, max_per_session=SMTP_MAX_PER_SESSION):
+        self.host, self.port = host, port
+        self.user, self.password = user, password
+        self.max_per_session = max_per_session
+        self.bucket = TokenBucket(rate)
+        self._idle = Queue()
+        self._slots = threading.BoundedSemaphore(size)   # sessions alive or being opened
+        self._closed = False
+
+    # ─── sessions ──────────────────────────────────────
+    def _connect(self) -> _Session:
+        try:
+            smtp = smtplib.SMTP(self.host, self.port, timeout=SMTP_TIMEOUT)
+        except OSError as e:
+            raise ConnectFailed(f"cannot connect to {self.host}:{self.port}: {e}") from e
+        try:
+            smtp.starttls()
+            if self.user:
+                smtp.login(self.user, self.password)
+        except Exception as e:
+            smtp.close()
+            raise ConnectFailed(f"STARTTLS/login to {self.host} failed: {e}") from e
+        return _Session(smtp)
+
+    @staticmethod
+    def _drop(session: _Session):
+        try:
+            session.smtp.quit()
+        except Exception:
+            session.smtp.close()
+
+    def _checkout(self) -> _Session:
+        self._slots.acquire()
+        try:
+            session = self._idle.get_nowait()
+        except Empty:
+            try:
+                return self._connect()
+            except Exception:
+                self._slots.release()
+                raise
+        if session.sent >= self.max_per_session:
+            self._drop(session)
+            return self._reconnect()
+        return session
+
+    def _reconnect(self) -> _Session:
+        # keeps the caller's slot
+        try:
+            return self._connect()
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _checkin(self, session: _Session):
+        if self._closed:
+            self._drop(session)
+        else:
+            self._idle.put(session)
+        self._slots.release()
+
+    # ─── sending ───────────────────────────────────────
+    def send(self, msg):
+        """Send one EmailMessage through a pooled session (rate-limited)."""
+        self.bucket.acquire()
+        session = self._checkout()
+        try:
+            session.smtp.send_message(msg)
+        except RECONNECT_ERRORS:
+            self._drop(session)
+            session = self._reconnect()
+            try:
+                session.smtp.send_message(msg)
+            except BaseException:
+                self._drop(session)
+                self._slots.release()
+                raise
+        except (smtplib.SMTPRecipientsRefused, smtplib.SMTPResponseException) as e:
+            # smtplib has RSET the transaction; the session is reusable unless
+            # the server said it is closing (421)
+            if getattr(e, "smtp_code", None) == 421:
+                self._drop(session)
+                self._slots.release()
+            else:
+                self._checkin(session)
+            raise
+        except BaseException:
+            # unknown state after a failed transaction; don't reuse it
+            self._drop(session)
+            self._slots.release()
+            raise
+        session.sent += 1
+        self._checkin(session)
+
+    def close(self):
+        """Log out every idle session (call once the campaign is done)."""
+        self._closed = True
+        while True:
+            try:
+                self._drop(self._idle.get_nowait())
+            except Empty:
+                break
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
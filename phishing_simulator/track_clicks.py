@@ -0,0 +1,246 @@
+"""
+track_clicks.py  –  receives the tracking-link clicks of send_phish.py
+
+    GET /click?id=<token>   → records the click, 302 to TRACK_LANDING_URL
+    GET /stats              → sent / clicked / click rate per scenario tag
+                              and per campaign
+    GET /healthz
+
+Tokens are resolved from an in-memory index (token → campaign, scenario,
+recipient) built from the send-event log (event_log.py, same EVENT_LOG /
+EVENT_DB settings as send_phish) and kept current by reading only the
+events appended since the last sync.  A click costs one dict
+lookup and a list append; a background task writes buffered clicks to
+SQLite in batches, and the per-group counters behind /stats are updated
+as clicks arrive, so nothing rescans the log or the click table.
+
+Only ids shaped like send_phish's tokens (32 hex digits) are considered,
+and only clicks on issued tokens are counted and stored.  A well-formed
+id not in the index yet (its send event not synced) waits in a bounded
+buffer (TRACK_UNRESOLVED_MAX ids, TRACK_UNRESOLVED_TTL seconds); ids that
+never resolve are dropped, so scanners cannot grow memory or the DB.
+
+Point send_phish at it with LINK_URL=http://<host>:8100/click
+
+Run:   uvicorn track_clicks:app --host 0.0.0.0 --port 8100
+"""
+
+import asyncio, os, re, sqlite3, time
+from collections import OrderedDict, defaultdict
+from fastapi import FastAPI, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import RedirectResponse
+from dotenv import load_dotenv
+from event_log import open_event_log
+
+# ─────────────────── config ────────────────────────────
+load_dotenv()
+
+CLICKS_DB      = os.getenv("TRACK_CLICKS_DB", "clicks.sqlite3")
+LANDING_URL    = os.getenv("TRACK_LANDING_URL", "https://google.com")
+FLUSH_EVERY    = float(os.getenv("TRACK_FLUSH_EVERY", "1"))     # seconds between click writes
+FLUSH_BATCH    = int(os.getenv("TRACK_FLUSH_BATCH", "500"))     # write early at this many clicks
+SYNC_EVERY     = float(os.getenv("TRACK_SYNC_EVERY", "5"))      # seconds between send-log reads
+UNRESOLVED_MAX = int(os.getenv("TRACK_UNRESOLVED_MAX", "10000"))  # unknown ids held until a sync
+UNRESOLVED_TTL = float(os.getenv("TRACK_UNRESOLVED_TTL", "300"))  # seconds before they are dropped
+CLICKS_PER_UNRESOLVED = 20                                      # clicks kept per unknown id
+
+TOKEN = re.compile(r"[0-9a-f]{32}")                              # uuid4().hex, as send_phish issues
+
+
+# ────────────────── token index ────────────────────────
+class TokenIndex:
+    """token → (campaign, scenario, recipient), synced incrementally from the event log."""
+
+    def __init__(self, log):
+        self.log = log
+        self.tokens = {}
+        self._cursor = 0
+
+    def read_new(self):
+        """The send events logged since the last call (runs in a thread)."""
+        events, self._cursor = self.log.read_since(self._cursor)
+        return [(e["token"], e.get("campaign") or "-", e.get("scenario") or "-", e.get("to"))
+                for e in events if e.get("token")]
+
+
+# ────────────────── click store ────────────────────────
+class ClickStore:
+    def __init__(self, path: str):
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS clicks ("
+                         " token TEXT NOT NULL, time REAL NOT NULL, ip TEXT, user_agent TEXT)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS clicks_token ON clicks(token)")
+        self._db.commit()
+
+    def counts(self) -> dict:
+        """token → clicks so far (read once at startup)."""
+        return dict(self._db.execute("SELECT token, COUNT(*) FROM clicks GROUP BY token"))
+
+    def write(self, batch):
+        self._db.executemany("INSERT INTO clicks (token, time, ip, user_agent) VALUES (?, ?, ?, ?)",
+                             batch)
+        self._db.commit()
+
+    def close(self):
+        self._db.close()
+
+
+# ────────────────── state ──────────────────────────────
+_index = None
+_store = None
+_pending = []                                   # clicks not yet written
+_clicks = defaultdict(int)                      # issued token → clicks
+_unresolved = OrderedDict()                     # unknown token → its clicks, oldest first
+_dropped = 0                                    # clicks on ids that never resolved
+_groups = {"scenario": defaultdict(lambda: {"sent": 0, "clicked": 0, "clicks": 0}),
+           "campaign": defaultdict(lambda: {"sent": 0, "clicked": 0, "clicks": 0})}
+_flush_now = None                               # asyncio.Event, set on a full buffer
+_running = False
+
+
+def _bump(token: str, field: str, n: int = 1):
+    campaign, scenario, _ = _index.tokens[token]
+    _groups["scenario"][scenario][field] += n
+    _groups["campaign"][campaign][field] += n
+
+
+def _add_tokens(entries):
+    for token, campaign, scenario, recipient in entries:
+        if token in _index.tokens:
+            continue
+        _index.tokens[token] = (campaign, scenario, recipient)
+        _bump(token, "sent")
+        if _clicks.get(token):                  # stored clicks, at startup
+            _bump(token, "clicked")
+            _bump(token, "clicks", _clicks[token])
+        # clicks that arrived before the send event did
+        for click in _unresolved.pop(token, ()):
+            _record_click(click)
+
+
+def _record_click(click: tuple):
+    global _dropped
+    token = click[0]
+    if token in _index.tokens:
+        _clicks[token] += 1
+        if _clicks[token] == 1:
+            _bump(token, "clicked")
+        _bump(token, "clicks")
+        _pending.append(click)
+        if len(_pending) >= FLUSH_BATCH:
+            _flush_now.set()
+        return
+    clicks = _unresolved.setdefault(token, [])
+    if len(clicks) < CLICKS_PER_UNRESOLVED:
+        clicks.append(click)
+    else:
+        _dropped += 1
+    if len(_unresolved) > UNRESOLVED_MAX:
+        _dropped += len(_unresolved.popitem(last=False)[1])
+
+
+def _expire_unresolved():
+    global _dropped
+    cutoff = time.time() - UNRESOLVED_TTL
+    while _unresolved:
+        token, clicks = next(iter(_unresolved.items()))
+        if clicks[0][1] >= cutoff:
+            break
+        _dropped += len(_unresolved.pop(token))
+
+
+async def _flush():
+    global _pending
+    if not _pending:
+        return
+    batch, _pending = _pending, []
+    try:
+        await run_in_threadpool(_store.write, batch)
+    except Exception as e:
+        print(f"Click write failed, keeping {len(batch)} clicks for the next flush: {e}")
+        _pending = batch + _pending
+
+
+async def _sync():
+    try:
+        _add_tokens(await run_in_threadpool(_index.read_new))
+    except Exception as e:
+        print(f"Send-log sync failed: {e}")
+    _expire_unresolved()
+
+
+async def _background():
+    last_sync = time.monotonic()
+    while _running:
+        try:
+            await asyncio.wait_for(_flush_now.wait(), FLUSH_EVERY)
+        except asyncio.TimeoutError:
+            pass
+        _flush_now.clear()
+        await _flush()
+        if time.monotonic() - last_sync >= SYNC_EVERY:
+            last_sync = time.monotonic()
+            await _sync()
+
+
+# ────────────────── FastAPI app ────────────────────────
+app = FastAPI(title="iCAT Phishing Click Tracker", version="1.0.0")
+
+
+@app.on_event("startup")
+async def _start():
+    global _index, _store, _flush_now, _running
+    _flush_now = asyncio.Event()
+    _running = True
+    _index = TokenIndex(open_event_log())
+    _store = ClickStore(CLICKS_DB)
+    _clicks.update(await run_in_threadpool(_store.counts))
+    _add_tokens(await run_in_threadpool(_index.read_new))
+    for token in [t for t in _clicks if t not in _index.tokens]:
+        del _clicks[token]                      # stored before ids were validated
+    app.state.background = asyncio.create_task(_background())
+    print(f"Tracking {len(_index.tokens)} tokens, {sum(_clicks.values())} clicks on record.")
+
+
+@app.on_event("shutdown")
+async def _stop():
+    # let the loop finish its current write instead of cancelling it mid-batch
+    global _running
+    _running = False
+    _flush_now.set()
+    await app.state.background
+    await _flush()
+    _store.close()
+    _index.log.close()
+
+
+@app.get("/click")
+async def click(request: Request, id: str = ""):
+    if TOKEN.fullmatch(id):
+        _record_click((id, time.time(),
+                       request.client.host if request.client else None,
+                       request.headers.get("user-agent")))
+    return RedirectResponse(LANDING_URL, status_code=302)
+
+
+def _with_rates(groups):
+    return {name: {**g, "click_rate": round(g["clicked"] / g["sent"], 4) if g["sent"] else None}
+            for name, g in groups.items()}
+
+
+@app.get("/stats")
+async def stats():
+    return {"by_scenario": _with_rates(_groups["scenario"]),
+            "by_campaign": _with_rates(_groups["campaign"]),
+            "tokens": len(_index.tokens),
+            "unresolved_ids": len(_unresolved),
+            "dropped_clicks": _dropped,
+            "pending_writes": len(_pending)}
+
+
+@app.get("/healthz")
+def healthz():
+    return {"status": "ok"}